@@ -4,13 +4,18 @@ import threading
 import time
 import os
 import faulthandler
+import signal
 
 
 from . import contour as cnt
 from . import tune as tu
 from . import groover as gr
 from . import player as pl
+from . import pipeline as pp
+from . import timing as tm
+from . import replay as rp
 from . import loeric_utils as lu
+from . import logger as log
 
 
 faulthandler.enable()
@@ -23,6 +28,62 @@ playback_resumed = threading.Condition()
 groover_lock = threading.Lock()
 
 
+# perform midi file
+def perform_tune(
+    loeric_id: str,
+    groover: gr.Groover,
+    player: pl.Player,
+    sync_port_out: mido.ports.BaseOutput,
+    **kwargs,
+):
+    """
+    Perform the tune with the given groover, one event at a time.
+
+    :param loeric_id: the id of the current LOERIC istance
+    :param groover: the groover object
+    :param player: the player, reset while playback is stopped
+    :param sync_port_out: the MIDI port for synchronization
+    :param kwargs: the performance arguments
+
+    :return: a generator of the lists of messages performed for each event, with the time in seconds spent performing it.
+    """
+    # repeat as specified
+    # iterate over messages
+    while True:
+        if stopped.is_set():
+            player.reset()
+            with playback_resumed:
+                playback_resumed.wait()
+            player.init_playback()
+        message = groover.next_event()
+        if message is None:
+            break
+
+        if message.type == "sysex":
+            log.info(
+                "main",
+                "Repetition %d/%d",
+                message.data[0] + 1,
+                kwargs["repeat"],
+            )
+            continue
+        elif message.type == "songpos":
+            if sync_port_out is not None:
+                sync_port_out.send(message)
+                log.info(
+                    "sync",
+                    "%s SENT %d (%f)",
+                    loeric_id,
+                    message.pos,
+                    time.time(),
+                )
+
+        # make the groover play notes, meta messages are kept intact
+        perform_start = time.perf_counter()
+        new_messages = groover.perform(message)
+        yield new_messages, time.perf_counter() - perform_start
+
+
 # play midi file
 def play(
     loeric_id: str,
@@ -30,6 +91,9 @@ def play(
     tune: tu.Tune,
     out: mido.ports.BaseOutput,
     sync_port_out: mido.ports.BaseOutput,
+    timing: tm.TimingStats = None,
+    routes: list[tuple] = None,
+    active_notes: pl.ActiveNotes = None,
     **kwargs,
 ) -> None:
     global received_start
@@ -41,8 +105,48 @@ def play(
         :param groover: the groover object
         :param tune: the tune object
         :param sync_port_out: the MIDI port for synchronization
+        :param timing: where the player records the timing of the messages sent
+        :param routes: the additional output ports, as tuples (port, channels, types)
+        :param active_notes: where the player tracks the notes and pitch bends sent
         :param kwargs: the performance arguments
         """
+        routes = [] if routes is None or out is None else routes
+
+        # align with the slowest calibrated port
+        latencies = {}
+        latency, reference_latency = 0.0, None
+        if kwargs["latency_file"] is not None and out is not None:
+            latencies = pl.load_latencies(kwargs["latency_file"])
+            latency = pl.get_latency(latencies, out.name)
+            reference_latency = max([latency, *latencies.values()])
+
+        # each additional port is sent to by its own thread
+        senders = []
+        for port, channels, types in routes:
+            latency_offset = 0.0
+            if reference_latency is not None:
+                port_latency = pl.get_latency(latencies, port.name)
+                latency_offset = max(reference_latency - port_latency, 0.0)
+            senders.append(
+                pl.PortSender(
+                    port,
+                    channels=channels,
+                    types=types,
+                    latency_offset=latency_offset,
+                    spin_budget=kwargs["spin_budget"] / 1000,
+                )
+            )
+
+        output_path = None
+        if kwargs["save"]:
+            output_path = lu.get_output_path(
+                kwargs["source"],
+                kwargs["seed"],
+                loeric_id,
+                output_dir=kwargs["output_dir"],
+                filename=kwargs["filename"],
+            )
+
         # create player
         player = pl.Player(
             tempo=groover.tempo,
@@ -51,6 +155,25 @@ def play(
             save=kwargs["save"],
             verbose=kwargs["verbose"],
             midi_out=out,
+            message_filter=(
+                None
+                if kwargs["no_dedup"]
+                else pl.ChangeFilter(
+                    cc_deadband=kwargs["cc_deadband"],
+                    bend_deadband=kwargs["bend_deadband"],
+                    tempo_deadband=kwargs["tempo_deadband"],
+                    max_rate=kwargs["max_rate"],
+                )
+            ),
+            spin_budget=kwargs["spin_budget"] / 1000,
+            latency=latency,
+            reference_latency=reference_latency,
+            # record live performances while they are played
+            save_path=output_path if out is not None else None,
+            rotate_minutes=kwargs["rotate"],
+            timing=timing,
+            routes=senders,
+            active_notes=active_notes,
         )
 
         # wait for start
@@ -59,34 +182,22 @@ def play(
 
         player.init_playback()
 
-        # repeat as specified
-        # iterate over messages
-        while True:
-            if stopped.is_set():
-                player.reset()
-                with playback_resumed:
-                    playback_resumed.wait()
-                player.init_playback()
-            message = groover.next_event()
-            if message is None:
-                break
-
-            if message.type == "sysex":
-                print(f"Repetition {message.data[0]+1}/{kwargs['repeat']}")
-                continue
-            # perform notes
-            elif lu.is_note(message):
-                # make the groover play the messages
-                new_messages = groover.perform(message)
-            # keep meta messages intact
+        # offline export, no live control or sync needed
+        if kwargs["save"] and out is None and not kwargs["sync"]:
+            player.play(groover.render())
+        else:
+            performance = perform_tune(
+                loeric_id, groover, player, sync_port_out, **kwargs
+            )
+            # run the groover ahead of playback when no sync message
+            # needs to act on the exact playback position
+            if out is not None and not kwargs["sync"] and kwargs["lookahead"] > 0:
+                pp.Pipeline(player, lookahead=kwargs["lookahead"] / 1000).play(
+                    performance
+                )
             else:
-                if message.type == "songpos":
-                    if sync_port_out is not None:
-                        sync_port_out.send(message)
-                        print(f"{loeric_id} SENT {message.pos} ({time.time()})")
-                new_messages = groover.perform(message)
-            # play
-            player.play(new_messages)
+                for new_messages, perform_time in performance:
+                    player.play(new_messages, perform_time)
 
         # play an end note
         if not kwargs["no_end_note"]:
@@ -94,19 +205,16 @@ def play(
             groover.advance_contours()
             player.play(groover.get_end_notes())
 
-        if kwargs["save"]:
-            name = os.path.splitext(os.path.basename(kwargs["source"]))[0]
-            if kwargs["output_dir"] is None:
-                dirname = os.path.dirname(kwargs["source"])
-            else:
-                if not os.path.isdir(kwargs["output_dir"]):
-                    os.makedirs(kwargs["output_dir"])
-                dirname = kwargs["output_dir"]
+        # turn off the drones
+        player.silence()
+        player.close()
+        if out is not None:
+            log.info("player", "Timing:\t%s", player.timing)
+            for sender in senders:
+                log.info("player", "Timing %s:\t%s", sender.port.name, sender.timing)
 
-            filename = kwargs["filename"]
-            if filename is None:
-                filename = f"generated_{name}_{kwargs['seed']}_{loeric_id}.mid"
-            player.save(f"{dirname}/{filename}")
+        if kwargs["save"]:
+            player.save(output_path)
 
         done_playing.set()
         print("Player thread terminated.")
@@ -120,41 +228,34 @@ def play(
 
 
 def sync_thread(
-    groover: gr.Groover, sync_port_in: mido.ports.BaseInput, out: mido.ports.BaseOutput
+    groover: gr.Groover,
+    sync_port_in: mido.ports.BaseInput,
+    out: mido.ports.BaseOutput,
+    recorder: rp.InputRecorder = None,
 ) -> None:
     """
     Handle MIDI start, stop, songpos and tempo messages.
+
+    :param recorder: if given, every message received is recorded.
     """
     global stopped
     while not done_playing.is_set():
         msg = sync_port_in.receive(block=True)
-        if msg.type == "sysex" and msg.data[0] == 69:
-            tempo = sum(msg.data[1:])
-            groover.set_tempo(tempo)
-            print(f"Received SET TEMPO {tempo}.")
-        elif msg.type == "reset":
-            groover.reset_clock()
-            print(f"Received RESET.")
-        elif msg.type == "clock":
-            groover.set_clock()
-            print(f"Received CLOCK.")
-        elif msg.type == "songpos":
-            print(f"Received JUMP {msg.pos}.")
-            if stopped.is_set():
-                groover.jump_to_pos(msg.pos)
-            else:
-                print(f"Ignoring JUMP because playback is active.")
-        elif msg.type == "start":
+        if recorder is not None:
+            recorder.record(rp.SYNC, msg)
+        if msg.type == "start":
             received_start.release(n=2)
-            print("Received START.")
+            log.info("sync", "Received START.")
         elif msg.type == "stop":
             stopped.set()
-            print("Received STOP.")
+            log.info("sync", "Received STOP.")
         elif msg.type == "continue":
             stopped.clear()
             with playback_resumed:
                 playback_resumed.notify_all()
-            print("Received CONTINUE.")
+            log.info("sync", "Received CONTINUE.")
+        else:
+            rp.apply_sync(groover, msg, stopped.is_set())
 
     print("Sync thread terminated.")
 
@@ -168,6 +269,11 @@ def main():
         help="list available input and output MIDI ports and exit.",
         action="store_true",
     )
+    parser.add_argument(
+        "--profile-startup",
+        help="print how long importing LOERIC and its dependencies takes and exit.",
+        action="store_true",
+    )
     parser.add_argument("source", help="the midi file to play.", nargs="?", default="")
     parser.add_argument(
         "-n",
@@ -238,7 +344,7 @@ def main():
     )
     parser.add_argument(
         "--save",
-        help="whether or not to export the performance. Playback will be disabled.",
+        help="whether or not to export the performance. Playback will be disabled. If no output port is given, the tune is rendered offline.",
         action="store_true",
     )
     parser.add_argument(
@@ -264,6 +370,12 @@ def main():
         default=None,
     )
     dir_path = os.path.dirname(os.path.realpath(__file__))
+    parser.add_argument(
+        "--rotate",
+        help="when saving a live performance, start a new file every given number of minutes.",
+        type=float,
+        default=None,
+    )
     parser.add_argument(
         "--config",
         help="the path to a configuration file. Every option included in the configuration file will override command line arguments.",
@@ -281,6 +393,85 @@ def main():
         action="store_true",
     )
 
+    parser.add_argument(
+        "--no-dedup",
+        help="send every control change, tempo and pitch bend message, even if its value did not change",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cc-deadband",
+        help="control changes differing from the last sent value by at most this amount are not sent",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--bend-deadband",
+        help="pitch bends differing from the last sent value by at most this amount are not sent",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--tempo-deadband",
+        help="tempo changes differing from the last sent value by at most this amount of bpms are not sent",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "--max-rate",
+        help="the maximum number of control change, tempo and pitch bend messages per second",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--spin-budget",
+        help="how many milliseconds before each message the player stops sleeping and busy-waits, trading CPU for timing accuracy. 0 disables busy-waiting.",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--latency-file",
+        help="a JSON file with the measured output latency of each MIDI port in milliseconds. Messages are delayed so that all the calibrated ports sound together.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--route",
+        help="send the performance to an additional output port, as PORT[:FILTER] where FILTER is a comma separated list of MIDI channels and message types, e.g. 2:2 for the drone channel. Messages matched by a filter are not sent to the main output. Can be repeated.",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--timing-file",
+        help="export the timing of every message sent to this file at the end of playback, and whenever SIGUSR1 is received. A .csv file holds one row per message, any other file a JSON summary with percentiles and histograms.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--record-inputs",
+        help="record the control and sync messages received to this file, to replay them with loeric-replay.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--lookahead",
+        help="how many milliseconds ahead of playback the performance is generated, in a separate thread. Control changes take effect within this delay. 0 generates each event right before playing it. Not used with --sync.",
+        type=float,
+        default=100,
+    )
+
+    parser.add_argument(
+        "--log-level",
+        help="the minimum level of the diagnostic messages to print.",
+        choices=list(log.LEVELS.keys()),
+        default="info",
+    )
+    parser.add_argument(
+        "--log-categories",
+        help="the comma separated categories of diagnostic messages to print. Defaults to all categories.",
+        type=str,
+        default=None,
+    )
+
     input_args = parser.add_mutually_exclusive_group()
     input_args.add_argument(
         "--create-in",
@@ -333,6 +524,19 @@ def main():
     args = parser.parse_args()
     args = vars(args)
 
+    if args["profile_startup"]:
+        lu.profile_startup("loeric.__main__")
+        return
+
+    log.configure(
+        level=log.LEVELS[args["log_level"]],
+        categories=(
+            None
+            if args["log_categories"] is None
+            else args["log_categories"].split(",")
+        ),
+    )
+
     # loeric instance id
     if args["name"] is None:
         loeric_id = int(time.time())
@@ -407,12 +611,24 @@ def main():
         sync_port_in = mido.open_input(sync_inport)
         sync_port_out = mido.open_output(sync_outport)
 
+    # open additional outputs
+    routes = []
+    for spec in args["route"]:
+        index, channels, types = lu.parse_route(spec)
+        route_out = mido.open_output(mido.get_output_names()[index])
+        routes.append((route_out, channels, types))
+
     # consistency with MIDI spec and mido
     args["midi_channel"] -= 1
 
     if not args["sync"] and not args["no_prompt"]:
         input("Press any key to start playback:")
 
+    # notes sent by the player, turned off on exit
+    active_notes = pl.ActiveNotes()
+    recorder = None
+    timing = None
+
     # start the player thread
     try:
         # load a tune
@@ -438,16 +654,56 @@ def main():
             syncing=args["sync"],
         )
 
+        if args["record_inputs"] is not None:
+            recorder = rp.InputRecorder(
+                args["record_inputs"],
+                settings={
+                    **{key: args[key] for key in rp.SETTINGS_DEFAULTS},
+                    "source": os.path.abspath(args["source"]),
+                    "config": (
+                        None
+                        if args["config"] is None
+                        else os.path.abspath(args["config"])
+                    ),
+                    "midi_channel": args["midi_channel"] + 1,
+                },
+            )
+
         # set input callback
         if port is not None:
             port.callback = groover.check_midi_control()
+            if recorder is not None:
+                port.callback = recorder.wrap(port.callback, rp.CONTROL)
 
         if args["sync"]:
+            # jumps restore the state of a straight performance
+            groover.compute_checkpoints()
             print("\nWaiting for START message...")
 
+        # individual records are only exported to CSV files
+        timing = tm.TimingStats(
+            keep_records=args["timing_file"] is not None
+            and args["timing_file"].lower().endswith(".csv")
+        )
+        if args["timing_file"] is not None and hasattr(signal, "SIGUSR1"):
+            # export the timing measured so far on demand
+            signal.signal(
+                signal.SIGUSR1,
+                lambda signum, frame: timing.export(args["timing_file"]),
+            )
+
         player_t = threading.Thread(
             target=play,
-            args=(loeric_id, groover, tune, out, sync_port_out),
+            args=(
+                loeric_id,
+                groover,
+                tune,
+                out,
+                sync_port_out,
+                timing,
+                routes,
+                active_notes,
+            ),
             kwargs=args,
         )
         player_t.start()
@@ -455,7 +711,7 @@ def main():
         if args["sync"]:
 
             sync_t = threading.Thread(
-                target=sync_thread, args=(groover, sync_port_in, out)
+                target=sync_thread, args=(groover, sync_port_in, out, recorder)
             )
             sync_t.start()
 
@@ -469,6 +725,12 @@ def main():
     except KeyboardInterrupt:
         print("\nPlayback stopped by user.")
 
+    if timing is not None and args["timing_file"] is not None and out is not None:
+        timing.export(args["timing_file"])
+
+    if recorder is not None:
+        recorder.close()
+
     # close midi input
     if port is not None:
         port.close()
@@ -476,14 +738,19 @@ def main():
         if port.closed:
             print("Closed MIDI input.")
 
-    # make sure to turn off all notes
+    # make sure to turn off the notes still sounding
+    release = active_notes.release()
     if out is not None:
-        for i in range(127):
-            out.send(mido.Message("note_off", velocity=0, note=i, time=0))
-        out.reset()
+        for msg in release:
+            out.send(msg)
         out.close()
         if out.closed:
             print("Closed MIDI output.")
+    for route_out, channels, _ in routes:
+        for msg in release:
+            if channels is None or msg.channel in channels:
+                route_out.send(msg)
+        route_out.close()
 
     # close sync ports
     if args["sync"]:
@@ -495,3 +762,6 @@ def main():
         sync_port_out.close()
         if sync_port_out.closed:
             print("Closed SYNC output.")
+
+    # write pending diagnostic messages
+    log.flush()
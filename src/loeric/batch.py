@@ -0,0 +1,370 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import time
+import traceback
+
+from . import tune as tu
+from . import groover as gr
+from . import player as pl
+from . import loeric_utils as lu
+from .loeric_config import loeric_config as lc
+
+
+# job fields and their default values
+JOB_DEFAULTS = {
+    "source": None,
+    "config": None,
+    "seed": 0,
+    "bpm": None,
+    "transpose": 0,
+    "repeat": 1,
+    "midi_channel": 1,
+    "diatonic": False,
+    "human_impact": 0,
+    "no_end_note": False,
+    "name": None,
+    "filename": None,
+    "output_dir": None,
+}
+
+# fields that can hold a list of values to expand into several jobs
+EXPANDABLE = ["source", "config", "seed", "bpm", "transpose"]
+
+# tunes parsed by the current process
+_tune_cache = {}
+
+
+def load_manifest(path: str) -> list[dict]:
+    """
+    Load a batch manifest and expand it into a list of jobs.
+    The manifest is a JSON file holding either a list of jobs or a dictionary with a "jobs" list and optional "defaults" applied to every job.
+    Any of the fields "source", "config", "seed", "bpm" and "transpose" can be a list, in which case one job is created for every combination of values.
+    The name and filename of an entry expanded into several jobs are suffixed with the index of the combination, so that the jobs are saved to different files.
+    Relative tune and configuration paths are resolved with respect to the manifest's directory.
+
+    :param path: the path to the manifest.
+
+    :return: the list of jobs, each with all fields set.
+    """
+    with open(path, "r") as f:
+        manifest = json.load(f)
+
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = manifest.get("defaults", {})
+        manifest = manifest["jobs"]
+
+    root = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p):
+        if isinstance(p, str):
+            return os.path.join(root, os.path.expanduser(p))
+        return p
+
+    jobs = []
+    for entry in manifest:
+        entry = {**JOB_DEFAULTS, **defaults, **entry}
+        unknown = set(entry) - set(JOB_DEFAULTS)
+        if len(unknown) != 0:
+            raise ValueError(f"Unknown job fields {sorted(unknown)}.")
+
+        values = []
+        for field in EXPANDABLE:
+            value = entry[field]
+            values.append(value if isinstance(value, list) else [value])
+
+        combinations = list(itertools.product(*values))
+        for k, combination in enumerate(combinations):
+            job = dict(entry)
+            job.update(zip(EXPANDABLE, combination))
+            if len(combinations) > 1:
+                if job["name"] is not None:
+                    job["name"] = f"{job['name']}_{k}"
+                if job["filename"] is not None:
+                    base, ext = os.path.splitext(job["filename"])
+                    job["filename"] = f"{base}_{k}{ext}"
+            job["source"] = resolve(job["source"])
+            job["config"] = resolve(job["config"])
+            if job["output_dir"] is not None:
+                job["output_dir"] = resolve(job["output_dir"])
+            if job["name"] is None:
+                job["name"] = str(len(jobs))
+            jobs.append(job)
+
+    return jobs
+
+
+def load_config(config) -> dict:
+    """
+    Load a performance configuration.
+
+    :param config: either None, the path to a JSON configuration file or a dictionary selecting configuration files by category as in `loeric-config` (e.g. {"instrument": "violin", "tune_type": "jig"}).
+
+    :return: the loaded configuration, or None if no configuration was given.
+    """
+    if config is None:
+        return None
+    if isinstance(config, str):
+        with open(config, "r") as f:
+            return json.load(f)
+    return lc.performance_config(config)
+
+
+def _config_key(config) -> str:
+    """
+    :return: a key identifying a configuration specification.
+    """
+    return json.dumps(config, sort_keys=True)
+
+
+def _get_tune(source: str, repeat: int) -> tuple[tu.Tune, bool]:
+    """
+    Return the parsed tune, parsing it only once per process.
+
+    :param source: the path to the tune.
+    :param repeat: how many times the tune should be repeated.
+
+    :return: a tuple (tune, cached) where cached is True if the tune had been parsed before.
+    """
+    key = (source, repeat)
+    cached = key in _tune_cache
+    if not cached:
+        _tune_cache[key] = tu.Tune(source, repeat)
+    return _tune_cache[key], cached
+
+
+def output_path(job: dict) -> str:
+    """
+    :param job: a job.
+
+    :return: the path of the file where the job is saved.
+    """
+    return lu.get_output_path(
+        job["source"],
+        job["seed"],
+        job["name"],
+        output_dir=job["output_dir"],
+        filename=job["filename"],
+    )
+
+
+def render_job(job: dict, config: dict = None) -> dict:
+    """
+    Render a single job offline and save it as a midi file.
+
+    :param job: the job to render.
+    :param config: the merged configuration for the job.
+
+    :return: a summary of the job, including the time spent in each phase.
+    """
+    summary = {
+        "name": job["name"],
+        "source": job["source"],
+        "config": job["config"],
+        "seed": job["seed"],
+        "bpm": job["bpm"],
+        "transpose": job["transpose"],
+        "output": None,
+        "error": None,
+    }
+    start = time.perf_counter()
+    try:
+        t = time.perf_counter()
+        tune, cached = _get_tune(job["source"], job["repeat"])
+        summary["tune_cached"] = cached
+        summary["tune_time"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        groover = gr.Groover(
+            tune,
+            bpm=job["bpm"],
+            midi_channel=job["midi_channel"] - 1,
+            transpose=job["transpose"],
+            diatonic_errors=job["diatonic"],
+            random_weight=0.2,
+            human_impact=job["human_impact"],
+            seed=job["seed"],
+            config=config,
+        )
+        summary["instantiate_time"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        player = pl.Player(
+            tempo=groover.tempo,
+            key_signature=tune.key_signature,
+            time_signature=tune.time_signature,
+            save=True,
+            midi_out=None,
+            message_filter=pl.ChangeFilter(),
+        )
+        player.init_playback()
+        player.play(groover.render())
+        if not job["no_end_note"]:
+            groover.reset_contours()
+            groover.advance_contours()
+            player.play(groover.get_end_notes())
+        summary["render_time"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        output = output_path(job)
+        player.save(output)
+        summary["save_time"] = time.perf_counter() - t
+        summary["output"] = output
+    except Exception as e:
+        summary["error"] = "".join(traceback.format_exception_only(e)).strip()
+
+    summary["total_time"] = time.perf_counter() - start
+    return summary
+
+
+def _render_chunk(jobs: list[dict], configs: dict) -> list[dict]:
+    """
+    Render a list of jobs in the current process.
+
+    :param jobs: the jobs to render.
+    :param configs: the merged configurations, indexed by configuration key.
+
+    :return: the summary of each job.
+    """
+    return [render_job(job, configs[_config_key(job["config"])]) for job in jobs]
+
+
+def render_batch(
+    jobs: list[dict], workers: int = None, chunk_size: int = 8
+) -> list[dict]:
+    """
+    Render many jobs in parallel.
+    Configurations are merged once in the calling process, jobs are grouped by tune so that each worker process parses a tune only once, and chunks of jobs are distributed over a process pool.
+
+    :param jobs: the jobs to render, as returned by `load_manifest`.
+    :param workers: the number of worker processes. If None, the number of CPUs is used. If 1, jobs are rendered in the calling process.
+    :param chunk_size: the maximum number of jobs sent to a worker at once.
+
+    :return: the summary of each job, in the same order as the input jobs.
+
+    :raise ValueError: if several jobs would be saved to the same file.
+    """
+    # jobs saved to the same file would overwrite each other
+    outputs = {}
+    for i, job in enumerate(jobs):
+        path = os.path.abspath(output_path(job))
+        if path in outputs:
+            raise ValueError(
+                f"Jobs {outputs[path]} and {i} would both be saved to {path}."
+            )
+        outputs[path] = i
+
+    configs = {}
+    for job in jobs:
+        key = _config_key(job["config"])
+        if key not in configs:
+            configs[key] = load_config(job["config"])
+
+    # group jobs by tune
+    indexed = sorted(
+        enumerate(jobs), key=lambda x: (x[1]["source"], x[1]["repeat"], x[0])
+    )
+    chunks = []
+    for _, group in itertools.groupby(
+        indexed, key=lambda x: (x[1]["source"], x[1]["repeat"])
+    ):
+        group = list(group)
+        for i in range(0, len(group), chunk_size):
+            chunks.append(group[i : i + chunk_size])
+
+    summaries = [None] * len(jobs)
+
+    def collect(chunk, results):
+        for (index, _), summary in zip(chunk, results):
+            summaries[index] = summary
+
+    if workers == 1:
+        for chunk in chunks:
+            collect(chunk, _render_chunk([job for _, job in chunk], configs))
+        return summaries
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for chunk in chunks:
+            chunk_jobs = [job for _, job in chunk]
+            chunk_configs = {
+                _config_key(job["config"]): configs[_config_key(job["config"])]
+                for job in chunk_jobs
+            }
+            futures[executor.submit(_render_chunk, chunk_jobs, chunk_configs)] = chunk
+        for future in concurrent.futures.as_completed(futures):
+            collect(futures[future], future.result())
+
+    return summaries
+
+
+def print_summary(summaries: list[dict], elapsed: float) -> None:
+    """
+    Print a table with the timing of each job.
+
+    :param summaries: the job summaries.
+    :param elapsed: the wall clock time of the whole batch in seconds.
+    """
+    print()
+    print("NAME\tSEED\tTIME\tOUTPUT")
+    for s in summaries:
+        result = s["output"] if s["error"] is None else f"ERROR {s['error']}"
+        print(f"{s['name']}\t{s['seed']}\t{s['total_time']:.3f}\t{result}")
+
+    failed = len([s for s in summaries if s["error"] is not None])
+    job_time = sum(s["total_time"] for s in summaries)
+    print()
+    print(f"Jobs:\t{len(summaries)} ({failed} failed)")
+    print(f"Time:\t{elapsed:.3f}s elapsed, {job_time:.3f}s in jobs")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("manifest", help="the JSON file listing the jobs to render.")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="the number of worker processes. Defaults to the number of CPUs.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        help="the maximum number of jobs sent to a worker at once.",
+        type=int,
+        default=8,
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="the output directory for jobs that do not specify one. Defaults to each tune's directory.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--summary",
+        help="the path of the JSON file where the job summaries will be written.",
+        type=str,
+        default=None,
+    )
+    args = vars(parser.parse_args())
+
+    jobs = load_manifest(args["manifest"])
+    for job in jobs:
+        if job["output_dir"] is None:
+            job["output_dir"] = args["output_dir"]
+
+    start = time.perf_counter()
+    summaries = render_batch(
+        jobs, workers=args["workers"], chunk_size=args["chunk_size"]
+    )
+    elapsed = time.perf_counter() - start
+
+    print_summary(summaries, elapsed)
+
+    if args["summary"] is not None:
+        with open(args["summary"], "w") as f:
+            json.dump({"elapsed": elapsed, "jobs": summaries}, f, indent=4)
+
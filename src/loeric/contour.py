@@ -1,6 +1,5 @@
 import mido
 import numpy as np
-from scipy.signal import savgol_filter
 
 from . import tune
 from . import loeric_utils as lu
@@ -114,6 +113,9 @@ class Contour:
         array /= max(array)
 
         if savgol:
+            # scipy is slow to import and only needed to compute contours
+            from scipy.signal import savgol_filter
+
             window = 15
             array = np.pad(array, (window, window), "mean")
             array = savgol_filter(array, window, 3)
@@ -145,7 +147,11 @@ class HarmonicContour(Contour):
         chords_per_bar: int = 2,
         allowed_chords: np.array = np.zeros(12),
         transpose: int = 0,
+        rng: np.random.RandomState = None,
     ) -> None:
+        if rng is None:
+            rng = np.random
+
         # retrieve pitch and time info
         # note_events = [msg for msg in midi if "note" in msg.type]
         note_events = midi.filter(lambda x: "note" in x.type)
@@ -194,7 +200,7 @@ class HarmonicContour(Contour):
                 np.roll(allowed_chords, midi.root),
             )
             # choose the chord with the highest score
-            root = np.random.choice(np.argwhere(root_chord == root_chord.max())[0])
+            root = rng.choice(np.argwhere(root_chord == root_chord.max())[0])
 
             # check if the selected chord should be major according to the mode
             chord_quality = np.roll(lu.chord_quality, midi.major_root)[root]
@@ -235,18 +241,26 @@ class RandomContour(Contour):
     def __init__(self):
         super().__init__()
 
-    def calculate(self, midi: tune.Tune, extremes: tuple[float, float] = None) -> None:
+    def calculate(
+        self,
+        midi: tune.Tune,
+        extremes: tuple[float, float] = None,
+        rng: np.random.RandomState = None,
+    ) -> None:
         """
         Compute a random contour following a uniform distribution in the specified range, by default between 0 and 1.
 
         :param midi: the input tune.
         :param extremes: the upper and lower bound for the random contour. If None, the range will be (0, 1).
+        :param rng: the random number generator to use. If None, the global numpy generator is used.
         """
         note_events = midi.filter(lambda x: lu.is_note_on(x))
         size = len(note_events)
         if extremes is None:
             extremes = (0, 1)
-        self._contour = np.random.uniform(*extremes, size=size)
+        if rng is None:
+            rng = np.random
+        self._contour = rng.uniform(*extremes, size=size)
 
 
 class PhraseContour(Contour):
@@ -299,6 +313,7 @@ class IntensityContour(Contour):
         savgol: bool = True,
         shift: bool = False,
         scale: bool = False,
+        rng: np.random.RandomState = None,
     ) -> None:
         """
         Compute the contour as the weighted sum of O'Canainn component.
@@ -309,6 +324,7 @@ class IntensityContour(Contour):
         :param random_weight: the weight of the random component over the sum of the weighted O'Canainn scores. If None, the components will be averaged together.
         :param savgol: whether or not to apply a final savgol filtering step (recommended).
         :param shift: whether or not to apply a final shifting step to bring the mean of the array close to 0.5.
+        :param rng: the random number generator to use. If None, the global numpy generator is used.
         """
 
         weights = weights.astype(float)
@@ -336,7 +352,7 @@ class IntensityContour(Contour):
         if random_weight != 0:
             self._contour *= 1 - random_weight
             random_contour = RandomContour()
-            random_contour.calculate(midi, extremes=(0, 1))
+            random_contour.calculate(midi, extremes=(0, 1), rng=rng)
             self._contour += random_contour._contour * random_weight
 
         # savgol filtering
@@ -360,6 +376,10 @@ class IntensityContour(Contour):
 
         :return: the frequency score, the beat score, the ambitus score, the leap score and the length score.
         """
+        # the scores only depend on the tune
+        if "ocanainn_scores" in midi.contour_cache:
+            return midi.contour_cache["ocanainn_scores"]
+
         # retrieve pitch and time info
         note_events = midi.filter(lambda x: "note" in x.type)
         timings = np.array([msg.time for msg in note_events])
@@ -430,7 +450,11 @@ class IntensityContour(Contour):
         val = values[index]
         length_score = (timings > val).astype(float)
 
-        return frequency_score, beat_score, ambitus_score, leap_score, length_score
+        scores = (frequency_score, beat_score, ambitus_score, leap_score, length_score)
+        for score in scores:
+            score.setflags(write=False)
+        midi.contour_cache["ocanainn_scores"] = scores
+        return scores
 
 
 class MessageLengthContour(Contour):
@@ -512,6 +536,7 @@ class PatternContour(Contour):
         std_scale: float = 1,
         normalize: bool = False,
         period: float = 0.5,
+        rng: np.random.RandomState = None,
     ) -> None:
         """
         Create the contour by repeating the input weights over the specified period.
@@ -520,8 +545,11 @@ class PatternContour(Contour):
         :param mean: the pattern to repeat.
         :param std: the std of the pattern to repeat, for every item.
         :param period: the length of the pattern, in bars.
+        :param rng: the random number generator to use. If None, the global numpy generator is used.
         """
         assert len(mean) == len(std)
+        if rng is None:
+            rng = np.random
 
         # retrieve pitch and time info
         note_events = midi.filter(lambda x: "note" in x.type)
@@ -552,7 +580,7 @@ class PatternContour(Contour):
             pattern_means[index] = np.mean(mean[add_indexes])
             pattern_stds[index] = np.mean(std[add_indexes])
 
-        pattern = np.random.normal(
+        pattern = rng.normal(
             loc=pattern_means, scale=std_scale * pattern_stds, size=len(pattern_means)
         )
 
@@ -606,3 +634,33 @@ def weighted_sum(contours: list[Contour], weights: np.ndarray):
     new_contour._contour = result
 
     return new_contour
+
+
+def shared(contour_class: type, midi: tune.Tune, **kwargs) -> Contour:
+    """
+    Return a calculated contour that only depends on the tune and the given parameters.
+    The values are computed once per tune and shared, read-only, by all the contours returned for the same parameters, while each contour keeps its own position.
+    Only use it for contours without random components.
+
+    :param contour_class: the class of the contour.
+    :param midi: the input tune.
+    :param kwargs: the parameters passed to the contour's `calculate`.
+
+    :return: a new contour holding the shared values.
+    """
+    key = (
+        contour_class.__name__,
+        tuple(
+            (k, tuple(v.tolist()) if isinstance(v, np.ndarray) else v)
+            for k, v in sorted(kwargs.items())
+        ),
+    )
+    if key not in midi.contour_cache:
+        contour = contour_class()
+        contour.calculate(midi, **kwargs)
+        contour._contour.setflags(write=False)
+        midi.contour_cache[key] = contour._contour
+
+    contour = contour_class()
+    contour._contour = midi.contour_cache[key]
+    return contour
@@ -0,0 +1,73 @@
+import threading
+
+
+class ControlState:
+    """
+    A set of named live control values shared between threads.
+    Writers never modify published values: each write builds a new copy of the values and publishes it with a single reference assignment, together with a generation counter.
+    Readers therefore always obtain a consistent snapshot without taking any lock, and never wait for a writer.
+    Writers are serialized among themselves so that concurrent writes are not lost.
+    """
+
+    def __init__(self, values: dict):
+        """
+        Initialize the class.
+
+        :param values: the initial value of each control.
+        """
+        self._names = tuple(values.keys())
+        self._index = {name: i for i, name in enumerate(self._names)}
+        self._write_lock = threading.Lock()
+        # (generation, values), replaced as a whole on every write
+        self._published = (0, tuple(values.values()))
+
+    def __contains__(self, name: str) -> bool:
+        """
+        :return: whether a control with the given name exists.
+        """
+        return name in self._index
+
+    @property
+    def names(self) -> tuple[str]:
+        """
+        :return: the names of the controls, in the same order as the snapshot values.
+        """
+        return self._names
+
+    @property
+    def generation(self) -> int:
+        """
+        :return: the number of writes published so far.
+        """
+        return self._published[0]
+
+    def write(self, values: dict) -> None:
+        """
+        Publish new values for some of the controls. The other controls keep their current value.
+
+        :param values: the new value of each control to update.
+
+        :raise KeyError: if a control name does not exist.
+        """
+        with self._write_lock:
+            generation, current = self._published
+            new_values = list(current)
+            for name, value in values.items():
+                new_values[self._index[name]] = value
+            self._published = (generation + 1, tuple(new_values))
+
+    def snapshot(self) -> tuple[int, tuple]:
+        """
+        Read a consistent snapshot of all the controls without blocking.
+
+        :return: a tuple (generation, values) where values follow the order of `names`.
+        """
+        return self._published
+
+    def get(self, name: str):
+        """
+        :param name: the name of the control.
+
+        :return: the current value of the control.
+        """
+        return self._published[1][self._index[name]]
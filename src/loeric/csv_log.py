@@ -0,0 +1,83 @@
+import csv
+import threading
+
+
+class CsvLog:
+    """
+    A table written to a CSV file while rows are added.
+    Rows are appended to an in-memory buffer, which a background thread writes to disk in chunks, so that adding a row takes constant time however long the log is.
+    The file has the layout of a pandas DataFrame saved with `to_csv`: a header and a row index in the first column.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        columns: list[str],
+        flush_interval: float = 1.0,
+        flush_size: int = 4096,
+    ):
+        """
+        Initialize the class, create the file and start the writer thread.
+
+        :param path: the path to the CSV file. An existing file is overwritten.
+        :param columns: the names of the columns.
+        :param flush_interval: the maximum time in seconds between two writes to disk.
+        :param flush_size: the number of buffered rows that triggers a write to disk.
+        """
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["", *columns])
+        # number of rows added so far, used as index
+        self.count = 0
+
+        self._rows = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, *row) -> None:
+        """
+        Add a row.
+
+        :param row: the values of the row, one per column.
+        """
+        with self._condition:
+            self._rows.append((self.count, *row))
+            self.count += 1
+            if len(self._rows) >= self._flush_size:
+                self._condition.notify()
+
+    def _run(self) -> None:
+        """
+        Write the buffered rows to disk periodically, until the log is closed.
+        """
+        while True:
+            with self._condition:
+                if not self._closed and len(self._rows) < self._flush_size:
+                    self._condition.wait(self._flush_interval)
+                # swap the buffer, so that rows can be added while writing
+                rows = self._rows
+                self._rows = []
+                closed = self._closed
+
+            if len(rows) != 0:
+                self._writer.writerows(rows)
+                self._file.flush()
+            if closed:
+                break
+
+    def close(self) -> None:
+        """
+        Write the remaining rows and close the file.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._file.close()
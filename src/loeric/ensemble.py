@@ -0,0 +1,394 @@
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import mido
+import numpy as np
+
+from . import tune as tu
+from . import groover as gr
+from . import player as pl
+from . import loeric_utils as lu
+from . import logger as log
+from .batch import load_config
+
+
+# voice fields and their default values
+VOICE_DEFAULTS = {
+    "name": None,
+    "config": None,
+    "seed": None,
+    "midi_channel": None,
+    "transpose": 0,
+    "diatonic": False,
+    "human_impact": 0,
+}
+
+
+def load_ensemble(path: str) -> dict:
+    """
+    Load an ensemble description.
+    The description is a JSON file holding a "voices" list and optionally the "source" tune, its "repeat" count and the "bpm".
+    Each voice can set "name", "config", "seed", "midi_channel", "transpose", "diatonic" and "human_impact". Configurations are specified as in batch manifests.
+    By default, voice i is seeded with i and plays on MIDI channel 2i + 1, leaving the next channel for its drone.
+    Relative tune and configuration paths are resolved with respect to the description's directory.
+
+    :param path: the path to the ensemble description.
+
+    :return: the ensemble description, with all voice fields set.
+    """
+    with open(path, "r") as f:
+        ensemble = json.load(f)
+
+    root = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p):
+        if isinstance(p, str):
+            return os.path.join(root, os.path.expanduser(p))
+        return p
+
+    voices = []
+    for i, entry in enumerate(ensemble["voices"]):
+        voice = {**VOICE_DEFAULTS, **entry}
+        unknown = set(voice) - set(VOICE_DEFAULTS)
+        if len(unknown) != 0:
+            raise ValueError(f"Unknown voice fields {sorted(unknown)}.")
+        if voice["name"] is None:
+            voice["name"] = str(i)
+        if voice["seed"] is None:
+            voice["seed"] = i
+        if voice["midi_channel"] is None:
+            voice["midi_channel"] = 2 * i + 1
+        voice["config"] = resolve(voice["config"])
+        voices.append(voice)
+
+    return {
+        "source": resolve(ensemble.get("source")),
+        "repeat": ensemble.get("repeat", 1),
+        "bpm": ensemble.get("bpm"),
+        "voices": voices,
+    }
+
+
+class Ensemble:
+    """
+    Several groovers performing the same tune in a single process.
+    The voices share the tune and the contour components that only depend on it, and their performances are merged into a single stream ordered by time.
+    At every song position, the voices wait for each other and resume together, so they never drift apart by more than a beat.
+    Each voice keeps its own random state, swapped into the global random generators while it performs, so that the seed of a voice does not change the performance of the others.
+    """
+
+    def __init__(self, tune: tu.Tune, voices: list[dict], bpm: int = None):
+        """
+        Initialize the class.
+
+        :param tune: the tune that will be performed.
+        :param voices: the voices, as returned by `load_ensemble`.
+        :param bpm: the user-defined tempo in bpm for the tune.
+        """
+        self._tune = tune
+        self._voices = voices
+
+        configs = {}
+        self.groovers = []
+        # state of the global random generators for each voice
+        self._random_states = []
+        for voice in voices:
+            key = json.dumps(voice["config"], sort_keys=True)
+            if key not in configs:
+                configs[key] = load_config(voice["config"])
+            self.groovers.append(
+                gr.Groover(
+                    tune,
+                    bpm=bpm,
+                    midi_channel=voice["midi_channel"] - 1,
+                    transpose=voice["transpose"],
+                    diatonic_errors=voice["diatonic"],
+                    random_weight=0.2,
+                    human_impact=voice["human_impact"],
+                    seed=voice["seed"],
+                    config=configs[key],
+                    seed_random=False,
+                )
+            )
+            self.groovers[-1].seed_random()
+            self._random_states.append((random.getstate(), np.random.get_state()))
+
+    def _enter_voice(self, v: int) -> None:
+        """
+        Set the global random generators to the state of a voice, before it performs.
+
+        :param v: the index of the voice.
+        """
+        random_state, np_random_state = self._random_states[v]
+        random.setstate(random_state)
+        np.random.set_state(np_random_state)
+
+    def _leave_voice(self, v: int) -> None:
+        """
+        Save the state of the global random generators for a voice, after it performs.
+
+        :param v: the index of the voice.
+        """
+        self._random_states[v] = (random.getstate(), np.random.get_state())
+
+    @property
+    def tempo(self) -> int:
+        """
+        :return: the tempo of the first voice, which leads the ensemble.
+        """
+        return self.groovers[0].tempo
+
+    def check_midi_control(self):
+        """
+        Returns a function that forwards MIDI control messages to every voice.
+
+        :return: a callback function that updates all the voices.
+        """
+        callbacks = [g.check_midi_control() for g in self.groovers]
+
+        def callback(msg):
+            for c in callbacks:
+                c(msg)
+
+        return callback
+
+    def events(self):
+        """
+        Perform the tune with all the voices.
+        Voices are advanced lazily, one note at a time, so live control changes are heard as soon as in a single performance.
+        Only the first voice's tempo changes are kept, since the performance has a single tempo track.
+
+        :return: a generator of tuples (time, message) where time is the absolute time of the message in seconds, in increasing order.
+        """
+        n = len(self.groovers)
+        # time reached by each voice
+        times = [0.0] * n
+        # messages waiting to be played
+        pending = []
+        counts = [0] * n
+        order = itertools.count()
+        # voices waiting at the current song position
+        parked = []
+        finished = [False] * n
+        pos = None
+
+        while True:
+            # make sure that every running voice has a message waiting
+            for v, groover in enumerate(self.groovers):
+                if counts[v] != 0 or finished[v] or v in parked:
+                    continue
+                self._enter_voice(v)
+                while counts[v] == 0 and not finished[v] and v not in parked:
+                    message = groover.next_event()
+                    if message is None:
+                        finished[v] = True
+                        break
+
+                    if message.type == "sysex":
+                        if v == 0:
+                            log.info("main", "Repetition %d", message.data[0] + 1)
+                        continue
+
+                    for m in groover.perform(message):
+                        times[v] += m.time
+                        if message.type == "songpos":
+                            continue
+                        if m.type == "set_tempo" and v != 0:
+                            continue
+                        heapq.heappush(pending, (times[v], next(order), v, m))
+                        counts[v] += 1
+
+                    if message.type == "songpos":
+                        parked.append(v)
+                        pos = message.pos
+                self._leave_voice(v)
+
+            if len(pending) == 0:
+                if len(parked) == 0:
+                    return
+                # every voice reached the song position
+                # resume together after the slowest one
+                t = max(times[v] for v in parked)
+                for v in parked:
+                    times[v] = t
+                parked = []
+                yield t, mido.Message("songpos", pos=pos)
+                continue
+
+            t, _, v, m = heapq.heappop(pending)
+            counts[v] -= 1
+            yield t, m
+
+    def get_end_notes(self) -> list[mido.Message]:
+        """
+        Generate the end notes of all the voices, merged by time.
+
+        :return: the end notes as a list of messages with delta times.
+        """
+        notes = []
+        order = itertools.count()
+        for v, groover in enumerate(self.groovers):
+            self._enter_voice(v)
+            groover.reset_contours()
+            groover.advance_contours()
+            t = 0.0
+            for m in groover.get_end_notes():
+                t += m.time
+                notes.append((t, next(order), m))
+            self._leave_voice(v)
+        notes.sort()
+
+        messages = []
+        last = 0.0
+        for t, _, m in notes:
+            messages.append(m.copy(time=t - last))
+            last = t
+        return messages
+
+    def play(self, player: pl.Player, end_note: bool = True) -> None:
+        """
+        Perform the tune with all the voices on a single player.
+
+        :param player: the player.
+        :param end_note: whether or not to play the end notes.
+        """
+        player.init_playback()
+        last = 0.0
+        for t, m in self.events():
+            player.play([m.copy(time=t - last)])
+            last = t
+
+        if end_note:
+            player.play(self.get_end_notes())
+
+    @property
+    def channels(self) -> list[int]:
+        """
+        :return: the MIDI channels used by the voices and their drones.
+        """
+        channels = set()
+        for groover in self.groovers:
+            channels.add(groover._midi_channel)
+            channels.add(groover._config["drone"]["midi_channel"])
+        return sorted(channels)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "ensemble", help="the JSON file describing the voices of the ensemble."
+    )
+    parser.add_argument(
+        "source",
+        help="the tune to play. Overrides the tune of the ensemble description.",
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--list-ports",
+        help="list available input and output MIDI ports and exit.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="the input MIDI port for the control signals, sent to every voice.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="the output MIDI port for the performance.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-n",
+        "--name",
+        help="the name of this ensemble, used in the output filename.",
+        type=str,
+        default="ensemble",
+    )
+    parser.add_argument(
+        "--save",
+        help="whether or not to export the performance. If no output port is given, the tune is rendered without playback.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="the output directory for generated performances. Defaults to the tune's directory.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--filename",
+        help="the output filename for the generated performance.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--no-end-note",
+        help="whether or not to play the end notes.",
+        action="store_true",
+    )
+    args = vars(parser.parse_args())
+
+    inport, outport = lu.get_ports(
+        input_number=args["input"],
+        output_number=args["output"],
+        list_ports=args["list_ports"],
+        prompt_out=args["output"] is None and not args["save"],
+    )
+    if args["list_ports"]:
+        return
+
+    description = load_ensemble(args["ensemble"])
+    if args["source"] is not None:
+        description["source"] = args["source"]
+
+    tune = tu.Tune(description["source"], description["repeat"])
+    ensemble = Ensemble(tune, description["voices"], bpm=description["bpm"])
+
+    port = None if inport is None else mido.open_input(inport)
+    if port is not None:
+        port.callback = ensemble.check_midi_control()
+    out = None if outport is None else mido.open_output(outport)
+
+    player = pl.Player(
+        tempo=ensemble.tempo,
+        key_signature=tune.key_signature,
+        time_signature=tune.time_signature,
+        save=args["save"],
+        midi_out=out,
+        message_filter=pl.ChangeFilter(),
+    )
+
+    try:
+        ensemble.play(player, end_note=not args["no_end_note"])
+    except KeyboardInterrupt:
+        print("\nPlayback stopped by user.")
+
+    if args["save"]:
+        player.save(
+            lu.get_output_path(
+                description["source"],
+                description["voices"][0]["seed"],
+                args["name"],
+                output_dir=args["output_dir"],
+                filename=args["filename"],
+            )
+        )
+
+    if port is not None:
+        port.close()
+
+    # make sure to turn off the notes still sounding
+    player.silence()
+    if out is not None:
+        out.close()
+
+    log.flush()
@@ -2,14 +2,14 @@ import mido
 import os
 import jsonmerge
 import copy
+import functools
 import random
 import json
+import queue
 import threading
 import time
+import zlib
 import numpy as np
-import music21 as m21
-import threading
-import time
 
 from collections import defaultdict
 from collections.abc import Callable
@@ -17,7 +17,9 @@ from collections.abc import Callable
 
 from . import tune as tu
 from . import contour as cnt
+from . import control_state as cs
 from . import loeric_utils as lu
+from . import logger as log
 
 
 CUT = "cut"
@@ -26,6 +28,190 @@ ROLL = "roll"
 SLIDE = "slide"
 ERROR = "error"
 
+# quantization steps of cached pitch bend curves
+BEND_DIFF_STEP = 1 / 64
+BEND_EXPONENT_STEP = 1 / 256
+
+
+@functools.lru_cache(maxsize=4096)
+def _bend_template(resolution: int, diff_step: int, exponent_step: int) -> tuple[int]:
+    """
+    Compute the pitch bend values of a slide for quantized parameters.
+
+    :param resolution: the number of steps of the slide.
+    :param diff_step: the pitch difference in units of `BEND_DIFF_STEP` semitones.
+    :param exponent_step: the curve exponent in units of `BEND_EXPONENT_STEP`.
+
+    :return: the `resolution + 1` pitch bend values, from the full bend down to 0.
+    """
+    bend = max(min(4096.0 * diff_step * BEND_DIFF_STEP, 8191), -8192)
+    curve = np.arange(resolution, -1, -1) / resolution
+    curve **= exponent_step * BEND_EXPONENT_STEP
+    return tuple((curve * bend).astype(int).tolist())
+
+
+def get_bend_curve(resolution: int, diff: float, exponent: float) -> tuple[int]:
+    """
+    Return the pitch bend values of a slide of the given pitch difference.
+    Curves are cached for quantized pitch differences and exponents, so that they are only computed once.
+
+    :param resolution: the number of steps of the slide.
+    :param diff: the pitch difference in semitones.
+    :param exponent: the exponent of the slide curve.
+
+    :return: the `resolution + 1` pitch bend values, from the full bend down to 0.
+    """
+    return _bend_template(
+        resolution,
+        round(diff / BEND_DIFF_STEP),
+        round(exponent / BEND_EXPONENT_STEP),
+    )
+
+
+# number of harmony values, see `lu.get_chord_pitches`
+HARMONY_CODES = 48
+
+
+def compute_drone(
+    reference: int,
+    harmony: int,
+    strings: tuple[int],
+    free_strings: tuple[int],
+    harmony_shift: int,
+    root: int,
+    strings_at_once: int,
+    free_strings_at_once: int,
+) -> np.array:
+    """
+    Compute the drone notes to play with a note.
+
+    :param reference: the note to drone.
+    :param harmony: the current harmony value.
+    :param strings: the drone strings, from lowest to highest.
+    :param free_strings: the strings that can be droned regardless of the played note.
+    :param harmony_shift: the semitones to add to the harmony root.
+    :param root: the root of the tune in semitones if the root can be droned, None otherwise.
+    :param strings_at_once: the maximum number of strings to drone.
+    :param free_strings_at_once: the maximum number of free strings to drone.
+
+    :return: the drone notes.
+    """
+    harmony_root = int((harmony + harmony_shift) % 12)
+
+    allowed_harmony = set(lu.get_chord_pitches(int(harmony)).tolist())
+    if root is not None:
+        allowed_harmony.add((24 + root - harmony_root) % 12)
+
+    drone = []
+
+    # the string the note is played on and its neighbours
+    if len(strings) != 0:
+        distances = [reference - s if reference - s >= 0 else 127 for s in strings]
+        string = distances.index(min(distances))
+        index = []
+        if string > 0:
+            index.append(string - 1)
+        if string < len(strings) - 1:
+            index.append(string + 1)
+
+        drone_notes = [
+            strings[i]
+            for i in index
+            if (12 + strings[i] - harmony_root) % 12 in allowed_harmony
+        ]
+        drone_notes.sort(key=lambda n: abs(n - reference))
+        drone += drone_notes[:strings_at_once]
+
+    free_notes = [
+        n for n in free_strings if (12 + n - harmony_root) % 12 in allowed_harmony
+    ]
+    drone += free_notes[:free_strings_at_once]
+
+    return np.array(drone, dtype=int)
+
+
+@functools.lru_cache(maxsize=32)
+def drone_table(
+    strings: tuple[int],
+    free_strings: tuple[int],
+    harmony_shift: int,
+    root: int,
+    strings_at_once: int,
+    free_strings_at_once: int,
+) -> np.array:
+    """
+    Compute the drone notes for every midi note and harmony value.
+    Tables are cached, so Groovers sharing the same drone configuration compute them only once.
+
+    :param strings: the drone strings, from lowest to highest.
+    :param free_strings: the strings that can be droned regardless of the played note.
+    :param harmony_shift: the semitones to add to the harmony root.
+    :param root: the root of the tune in semitones if the root can be droned, None otherwise.
+    :param strings_at_once: the maximum number of strings to drone.
+    :param free_strings_at_once: the maximum number of free strings to drone.
+
+    :return: a read-only array of shape (128, `HARMONY_CODES`) holding the drone notes of each note and harmony value.
+    """
+    table = np.empty((128, HARMONY_CODES), dtype=object)
+    for reference in range(128):
+        for harmony in range(HARMONY_CODES):
+            drone = compute_drone(
+                reference,
+                harmony,
+                strings,
+                free_strings,
+                harmony_shift,
+                root,
+                strings_at_once,
+                free_strings_at_once,
+            )
+            drone.setflags(write=False)
+            table[reference, harmony] = drone
+    table.setflags(write=False)
+    return table
+
+
+# configuration sections from which contours are computed, in computation order
+CONTOUR_SECTIONS = ["velocity", "tempo", "ornament", "tune", "harmony"]
+
+
+def changed_parts(old: dict, new: dict) -> set[str]:
+    """
+    Find which parts of a Groover depend on the differences between two configurations.
+    Sections that are not listed here are read from the configuration during playback and only need the configuration to be replaced.
+
+    :param old: the current configuration.
+    :param new: the new configuration.
+
+    :return: the names of the parts to recompute, among "settings", "drone", "controls" and the contour sections in `CONTOUR_SECTIONS`.
+    """
+    parts = set()
+    for section in ["velocity", "tempo", "ornament", "harmony", "drone"]:
+        if old.get(section) != new.get(section):
+            parts.add(section)
+    if old.get("ornamentation") != new.get("ornamentation"):
+        parts.add("settings")
+    if old.get("control_2_contour") != new.get("control_2_contour"):
+        parts.add("controls")
+
+    old_values = old.get("values", {})
+    new_values = new.get("values", {})
+    changed_values = {
+        key
+        for key in set(old_values) | set(new_values)
+        if old_values.get(key) != new_values.get(key)
+    }
+    if changed_values & {"bpm", "midi_channel", "transpose", "legato_min", "legato_max"}:
+        parts.add("settings")
+    if "transpose" in changed_values:
+        parts.add("drone")
+    if "seed" in changed_values:
+        parts.update(["velocity", "tempo", "ornament", "harmony"])
+    if changed_values & {"phrase_levels", "legato_phrase_exp"}:
+        parts.update(["velocity", "tempo", "ornament"])
+
+    return parts
+
 
 class UnknownContourError(Exception):
     """Raised if trying to set a contour whose name does not correspond to any of the Groover's contours."""
@@ -47,9 +233,11 @@ class Groover:
         human_impact: float = 0,
         seed: int = 42,
         config_file: str = None,
+        config: dict = None,
         intensity_control: int = 1,
         human_impact_control: int = 11,
         syncing: bool = False,
+        seed_random: bool = True,
     ):
         """
         Initialize the groover class by setting user-defined parameters and creating the contours.
@@ -64,7 +252,9 @@ class Groover:
         :param human_impact: the initial weight of the external control signal.
         :param seed: the random seed of the performance.
         :param config_file: the path to the configuration file (must be a JSON file).
+        :param config: an already loaded configuration. If specified, `config_file` is ignored.
         :param syncing: whether or not synchronization with multiple LOERIC istances is active.
+        :param seed_random: whether or not to seed the global random generators used during the performance. If False, e.g. when the groover is built while another one is performing, `seed_random` must be called before the performance.
         """
 
         # tune
@@ -76,7 +266,11 @@ class Groover:
         # index to yield note events
         # will be increased before yielding message
         self._note_index = -1
-        self._note_index_lock = threading.Lock()
+        # song positions requested by other threads
+        self._pending_jumps = queue.SimpleQueue()
+        # configuration changes prepared by other threads
+        self._pending_reconfigurations = queue.SimpleQueue()
+        self._reconfigure_lock = threading.Lock()
         self._performance_time = -tune.offset
 
         # delay to randomize message length
@@ -136,11 +330,13 @@ class Groover:
         # use external configuration if specified
         # the configuration file overwrites any defaults
         # specified by command line
-        if config_file is not None:
+        if config is None and config_file is not None:
             with open(config_file, "r") as f:
-                config_file = json.load(f)
-            self._config = jsonmerge.merge(self._config, config_file)
-            config_hash = int(hash(str(config_file))) % 2**31
+                config = json.load(f)
+        if config is not None:
+            self._config = jsonmerge.merge(self._config, config)
+            # stable across processes, unlike hash()
+            config_hash = zlib.crc32(str(config).encode()) % 2**31
             self._config["values"]["seed"] = config_hash + seed
 
         self._initial_human_impact = human_impact
@@ -149,242 +345,394 @@ class Groover:
 
         # generate all parameter settings and contours
         self._instantiate()
+        if seed_random:
+            self.seed_random()
 
     def _instantiate(self):
         """
         Generate all parameter settings following the current configuration.
         """
 
-        # random seed
-        random.seed(self._config["values"]["seed"])
-        np.random.seed(self._config["values"]["seed"])
+        # private random generators, leaving the global ones
+        # to the performance, which may be running in another groover
+        seed = self._config["values"]["seed"]
+        python_rng = random.Random(seed)
+        rng = np.random.RandomState(seed)
 
         # set parameters
-        if self._config["values"]["bpm"] is None:
-            self._user_tempo = self._tune.tempo
-        else:
-            self._user_tempo = mido.bpm2tempo(self._config["values"]["bpm"])
-
-        self._midi_channel = self._config["values"]["midi_channel"]
-        self._transpose_semitones = self._config["values"]["transpose"]
+        self.__dict__.update(self._compute_settings(self._config))
         # table for pitch errors
         self._pitch_errors = defaultdict(int)
 
-        self._max_ornament_length = 0
-        for o in self._config["ornamentation"]:
-            self._max_ornament_length = max(
-                self._max_ornament_length, self._config["ornamentation"][o]["length"]
-            )
-
-        # legato
-        self._legato_amount = (
-            self._config["values"]["legato_max"] - self._config["values"]["legato_min"]
-        )
-
         # droning
-        self._drone_notes = np.array(self._config["drone"]["strings"])
-        self._free_drone_notes = np.array(self._config["drone"]["free_strings"])
-        self._drone_threshold = float(self._config["drone"]["threshold"])
-        self._drone_bound_contour = self._config["drone"]["bind"]
+        self.__dict__.update(self._compute_drone_settings(self._config))
         self._last_played_drones = []
+        # note offs of drones stopped by a reconfiguration, sent with the next performed message
+        self._released_drones = []
 
         # tempo sync
         self._external_tempo = None
-        self._tempo_lock = threading.Lock()
         self._last_clock_time = None
 
         # create contours
         self._contours = {}
+        for section in CONTOUR_SECTIONS:
+            self._contours.update(self._compute_contours(section, self._config, rng))
 
-        # velocity contour
-        velocity_intensity_contour = cnt.IntensityContour()
-        velocity_intensity_contour.calculate(
-            self._tune,
-            weights=np.array(self._config["velocity"]["weights"]),
-            random_weight=self._config["velocity"]["random"],
-            savgol=self._config["velocity"]["savgol"],
-            scale=self._config["velocity"]["scale"],
-            shift=self._config["velocity"]["shift"],
-        )
+        # object holding each contour's value in a given moment
+        self._contour_values = {}
 
-        # pattern contour
-        self._contours["velocity_pattern"] = cnt.PatternContour()
-        self._contours["velocity_pattern"].calculate(
-            self._tune,
-            mean=np.array(self._config["velocity"]["pattern_means"]),
-            std=np.array(self._config["velocity"]["pattern_stds"]),
-            period=self._config["velocity"]["period"],
-        )
+        for contour_name in self._config["control_2_contour"]:
+            self._contour_values[contour_name] = 0.5
 
-        velocity_pitch_contour = cnt.PitchContour()
-        velocity_pitch_contour.calculate(
-            self._tune, savgol=True, shift=True, scale=True
-        )
+        # init all contours
+        for contour_name in self._contours:
+            # init the human contours
+            self._contour_values[contour_name] = 0.5
+            self._contour_values[f"{contour_name}_intensity"] = 0.5
+            self._contour_values[f"{contour_name}_human_impact"] = (
+                self._initial_human_impact
+            )
 
-        velocity_phrasing_contour = cnt.PhraseContour()
-        velocity_phrasing_contour.calculate(
-            self._tune,
-            phrase_levels=self._config["values"]["phrase_levels"],
-            phrase_exp=self._config["velocity"]["phrase_exp"],
+        # live values written by the MIDI callback and sync threads
+        # and read by the playback thread once per note
+        self._controls = cs.ControlState(
+            {**self._contour_values, "external_tempo": None}
         )
+        self._controls_generation = self._controls.generation
 
-        velocity_phrasing_contour = cnt.PhraseContour()
-        velocity_phrasing_contour.calculate(self._tune)
+        # the configuration the next reconfiguration is applied to
+        self._target_config = self._config
 
-        self._contours["velocity"] = cnt.weighted_sum(
-            [
-                velocity_intensity_contour,
-                velocity_pitch_contour,
-                velocity_phrasing_contour,
-            ],
-            np.array(
-                [
-                    1
-                    - self._config["velocity"]["high_loud_weight"]
-                    - self._config["velocity"]["phrase_weight"],
-                    self._config["velocity"]["high_loud_weight"],
-                    self._config["velocity"]["phrase_weight"],
-                ]
-            ),
+        # performance state at each song position
+        self._checkpoints = {}
+        self._start_checkpoint = self._checkpoint(
+            random_state=python_rng.getstate(), np_random_state=rng.get_state()
         )
 
-        # tempo contour
-        tempo_intensity_contour = cnt.IntensityContour()
-        tempo_intensity_contour.calculate(
-            self._tune,
-            weights=np.array(self._config["tempo"]["weights"]),
-            random_weight=self._config["tempo"]["random"],
-            savgol=self._config["tempo"]["savgol"],
-            scale=self._config["tempo"]["scale"],
-            shift=self._config["tempo"]["shift"],
-        )
-        tempo_phrasing_contour = cnt.PhraseContour()
-        tempo_phrasing_contour.calculate(
-            self._tune,
-            phrase_levels=self._config["values"]["phrase_levels"],
-            phrase_exp=self._config["tempo"]["phrase_exp"],
-        )
+    def _compute_settings(self, config: dict) -> dict:
+        """
+        Compute the parameters derived from the "values" and "ornamentation" sections of a configuration.
 
-        self._contours["tempo"] = cnt.weighted_sum(
-            [tempo_intensity_contour, tempo_phrasing_contour],
-            np.array(
-                [
-                    1 - self._config["tempo"]["phrase_weight"],
-                    self._config["tempo"]["phrase_weight"],
-                ]
-            ),
-        )
+        :param config: the configuration.
 
-        self._contours["phrasing"] = cnt.PhraseContour()
-        self._contours["phrasing"].calculate(
-            self._tune,
-            phrase_levels=self._config["values"]["phrase_levels"],
-            phrase_exp=self._config["values"]["legato_phrase_exp"],
-        )
+        :return: the value of each parameter, indexed by attribute name.
+        """
+        if config["values"]["bpm"] is None:
+            user_tempo = self._tune.tempo
+        else:
+            user_tempo = mido.bpm2tempo(config["values"]["bpm"])
 
-        self._contours["phrasing"] = cnt.PhraseContour()
-        self._contours["phrasing"].calculate(self._tune)
+        max_ornament_length = 0
+        for o in config["ornamentation"]:
+            max_ornament_length = max(
+                max_ornament_length, config["ornamentation"][o]["length"]
+            )
 
-        self._contours["tempo"] = cnt.weighted_sum(
-            [tempo_intensity_contour, self._contours["phrasing"]],
-            np.array(
-                [
-                    1 - self._config["tempo"]["phrase_weight"],
-                    self._config["tempo"]["phrase_weight"],
-                ]
+        return {
+            "_user_tempo": user_tempo,
+            "_midi_channel": config["values"]["midi_channel"],
+            "_transpose_semitones": config["values"]["transpose"],
+            "_max_ornament_length": max_ornament_length,
+            # legato
+            "_legato_amount": config["values"]["legato_max"]
+            - config["values"]["legato_min"],
+        }
+
+    def _compute_drone_settings(self, config: dict) -> dict:
+        """
+        Compute the parameters derived from the "drone" section of a configuration, including the drone table if droning is active.
+
+        :param config: the configuration.
+
+        :return: the value of each parameter, indexed by attribute name.
+        """
+        transpose = config["values"]["transpose"]
+        drone_args = (
+            tuple(int(n) for n in config["drone"]["strings"]),
+            tuple(int(n) for n in config["drone"]["free_strings"]),
+            0 if config["drone"]["transpose"] else transpose,
+            (
+                self._tune.root + transpose
+                if config["drone"]["allow_root"]
+                else None
             ),
+            config["drone"]["strings_at_once"],
+            config["drone"]["free_strings_at_once"],
         )
+        return {
+            "_drone_threshold": float(config["drone"]["threshold"]),
+            "_drone_bound_contour": config["drone"]["bind"],
+            "_drone_args": drone_args,
+            "_drone_table": (
+                drone_table(*drone_args) if config["drone"]["active"] else None
+            ),
+        }
 
+    def _compute_contours(
+        self, section: str, config: dict, rng: np.random.RandomState = None
+    ) -> dict[str, cnt.Contour]:
         """
-        import matplotlib.pyplot as plt
+        Compute the contours derived from a section of a configuration.
+
+        :param section: the contour section, one of `CONTOUR_SECTIONS`.
+        :param config: the configuration.
+        :param rng: the random number generator to use. If None, the global numpy generator is used.
 
-        plt.plot(self._contours["tempo"]._contour)
-        plt.show()
+        :return: the computed contours, indexed by name.
         """
+        contours = {}
 
-        self._contours["tempo_pattern"] = cnt.PatternContour()
-        self._contours["tempo_pattern"].calculate(
-            self._tune,
-            mean=np.array(self._config["tempo"]["pattern_means"]),
-            std=np.array(self._config["tempo"]["pattern_stds"]),
-            std_scale=self._config["tempo"]["std_scale"],
-            period=self._config["tempo"]["period"],
-            normalize=True,
-        )
+        if section == "velocity":
+            velocity_intensity_contour = cnt.IntensityContour()
+            velocity_intensity_contour.calculate(
+                self._tune,
+                weights=np.array(config["velocity"]["weights"]),
+                random_weight=config["velocity"]["random"],
+                savgol=config["velocity"]["savgol"],
+                scale=config["velocity"]["scale"],
+                shift=config["velocity"]["shift"],
+                rng=rng,
+            )
 
-        # ornament contour
-        ornament_intensity_contour = cnt.IntensityContour()
-        ornament_intensity_contour.calculate(
-            self._tune,
-            weights=np.array(self._config["ornament"]["weights"]),
-            random_weight=self._config["ornament"]["random"],
-            savgol=self._config["ornament"]["savgol"],
-            scale=self._config["ornament"]["scale"],
-            shift=self._config["ornament"]["shift"],
-        )
+            # pattern contour
+            contours["velocity_pattern"] = cnt.PatternContour()
+            contours["velocity_pattern"].calculate(
+                self._tune,
+                mean=np.array(config["velocity"]["pattern_means"]),
+                std=np.array(config["velocity"]["pattern_stds"]),
+                period=config["velocity"]["period"],
+                rng=rng,
+            )
 
-        ornament_phrasing_contour = cnt.PhraseContour()
-        ornament_phrasing_contour.calculate(
-            self._tune,
-            phrase_levels=self._config["values"]["phrase_levels"],
-            phrase_exp=self._config["ornament"]["phrase_exp"],
-        )
+            velocity_pitch_contour = cnt.shared(
+                cnt.PitchContour, self._tune, savgol=True, shift=True, scale=True
+            )
+
+            velocity_phrasing_contour = cnt.shared(
+                cnt.PhraseContour,
+                self._tune,
+                phrase_levels=config["values"]["phrase_levels"],
+                phrase_exp=config["velocity"]["phrase_exp"],
+            )
+
+            velocity_phrasing_contour = cnt.shared(cnt.PhraseContour, self._tune)
 
-        self._contours["ornament"] = cnt.weighted_sum(
-            [ornament_intensity_contour, ornament_phrasing_contour],
-            np.array(
+            contours["velocity"] = cnt.weighted_sum(
                 [
-                    1 - self._config["ornament"]["phrase_weight"],
-                    self._config["ornament"]["phrase_weight"],
-                ]
-            ),
-        )
-        """
-        import matplotlib.pyplot as plt
+                    velocity_intensity_contour,
+                    velocity_pitch_contour,
+                    velocity_phrasing_contour,
+                ],
+                np.array(
+                    [
+                        1
+                        - config["velocity"]["high_loud_weight"]
+                        - config["velocity"]["phrase_weight"],
+                        config["velocity"]["high_loud_weight"],
+                        config["velocity"]["phrase_weight"],
+                    ]
+                ),
+            )
 
-        plt.plot(self._contours["ornament"]._contour)
-        plt.show()
-        """
+        elif section == "tempo":
+            tempo_intensity_contour = cnt.IntensityContour()
+            tempo_intensity_contour.calculate(
+                self._tune,
+                weights=np.array(config["tempo"]["weights"]),
+                random_weight=config["tempo"]["random"],
+                savgol=config["tempo"]["savgol"],
+                scale=config["tempo"]["scale"],
+                shift=config["tempo"]["shift"],
+                rng=rng,
+            )
+            tempo_phrasing_contour = cnt.shared(
+                cnt.PhraseContour,
+                self._tune,
+                phrase_levels=config["values"]["phrase_levels"],
+                phrase_exp=config["tempo"]["phrase_exp"],
+            )
 
-        # message length contour
-        self._contours["message length"] = cnt.MessageLengthContour()
-        self._contours["message length"].calculate(self._tune)
+            contours["tempo"] = cnt.weighted_sum(
+                [tempo_intensity_contour, tempo_phrasing_contour],
+                np.array(
+                    [
+                        1 - config["tempo"]["phrase_weight"],
+                        config["tempo"]["phrase_weight"],
+                    ]
+                ),
+            )
 
-        # pich difference
-        self._contours["pitch difference"] = cnt.PitchDifferenceContour()
-        self._contours["pitch difference"].calculate(self._tune)
+            contours["phrasing"] = cnt.shared(
+                cnt.PhraseContour,
+                self._tune,
+                phrase_levels=config["values"]["phrase_levels"],
+                phrase_exp=config["values"]["legato_phrase_exp"],
+            )
 
-        # pich contour
-        self._contours["pitch contour"] = cnt.PitchContour()
-        self._contours["pitch contour"].calculate(
-            self._tune, savgol=False, shift=False, scale=False
-        )
+            contours["phrasing"] = cnt.shared(cnt.PhraseContour, self._tune)
 
-        self._contours["harmony"] = cnt.HarmonicContour()
-        self._contours["harmony"].calculate(
-            self._tune,
-            np.array(
-                self._config["harmony"]["chord_score"],
-            ),
-            chords_per_bar=self._config["harmony"]["chords_per_bar"],
-            allowed_chords=np.array(self._config["harmony"]["allowed_chords"]),
-        )
+            contours["tempo"] = cnt.weighted_sum(
+                [tempo_intensity_contour, contours["phrasing"]],
+                np.array(
+                    [
+                        1 - config["tempo"]["phrase_weight"],
+                        config["tempo"]["phrase_weight"],
+                    ]
+                ),
+            )
 
-        # object holding each contour's value in a given moment
-        self._contour_values = {}
+            """
+            import matplotlib.pyplot as plt
+
+            plt.plot(contours["tempo"]._contour)
+            plt.show()
+            """
+
+            contours["tempo_pattern"] = cnt.PatternContour()
+            contours["tempo_pattern"].calculate(
+                self._tune,
+                mean=np.array(config["tempo"]["pattern_means"]),
+                std=np.array(config["tempo"]["pattern_stds"]),
+                std_scale=config["tempo"]["std_scale"],
+                period=config["tempo"]["period"],
+                normalize=True,
+                rng=rng,
+            )
 
-        for contour_name in self._config["control_2_contour"]:
-            self._contour_values[contour_name] = 0.5
+        elif section == "ornament":
+            ornament_intensity_contour = cnt.IntensityContour()
+            ornament_intensity_contour.calculate(
+                self._tune,
+                weights=np.array(config["ornament"]["weights"]),
+                random_weight=config["ornament"]["random"],
+                savgol=config["ornament"]["savgol"],
+                scale=config["ornament"]["scale"],
+                shift=config["ornament"]["shift"],
+                rng=rng,
+            )
 
-        # init all contours
-        for contour_name in self._contours:
-            # init the human contours
-            self._contour_values[contour_name] = 0.5
-            self._contour_values[f"{contour_name}_intensity"] = 0.5
-            self._contour_values[f"{contour_name}_human_impact"] = (
-                self._initial_human_impact
+            ornament_phrasing_contour = cnt.shared(
+                cnt.PhraseContour,
+                self._tune,
+                phrase_levels=config["values"]["phrase_levels"],
+                phrase_exp=config["ornament"]["phrase_exp"],
+            )
+
+            contours["ornament"] = cnt.weighted_sum(
+                [ornament_intensity_contour, ornament_phrasing_contour],
+                np.array(
+                    [
+                        1 - config["ornament"]["phrase_weight"],
+                        config["ornament"]["phrase_weight"],
+                    ]
+                ),
+            )
+            """
+            import matplotlib.pyplot as plt
+
+            plt.plot(contours["ornament"]._contour)
+            plt.show()
+            """
+
+        elif section == "tune":
+            # message length contour
+            contours["message length"] = cnt.MessageLengthContour()
+            contours["message length"].calculate(self._tune)
+
+            # pich difference
+            contours["pitch difference"] = cnt.PitchDifferenceContour()
+            contours["pitch difference"].calculate(self._tune)
+
+            # pich contour
+            contours["pitch contour"] = cnt.PitchContour()
+            contours["pitch contour"].calculate(
+                self._tune, savgol=False, shift=False, scale=False
             )
 
+        elif section == "harmony":
+            contours["harmony"] = cnt.HarmonicContour()
+            contours["harmony"].calculate(
+                self._tune,
+                np.array(
+                    config["harmony"]["chord_score"],
+                ),
+                chords_per_bar=config["harmony"]["chords_per_bar"],
+                allowed_chords=np.array(config["harmony"]["allowed_chords"]),
+                rng=rng,
+            )
+
+        return contours
+
+    def reconfigure(self, patch: dict) -> set[str]:
+        """
+        Change part of the configuration during playback.
+        The patch is merged into the current configuration and only the parts derived from the changed sections are recomputed, in the calling thread.
+        The new configuration is then applied by the playback thread before the next note on, without moving the playback position.
+        Recomputed contours use a random generator seeded with the configuration seed, so they do not consume the random draws of the performance. Every contour section is drawn from it in order, as when the groover is created, and only the changed ones are kept.
+
+        :param patch: the configuration values to change, with the same structure as a configuration file.
+
+        :return: the names of the recomputed parts, among "settings", "drone", "controls" and the contour sections in `CONTOUR_SECTIONS`.
+        """
+        with self._reconfigure_lock:
+            old = self._target_config
+            new = jsonmerge.merge(old, patch)
+            parts = changed_parts(old, new)
+
+            update = {"config": new, "attributes": {}, "contours": {}}
+            if "settings" in parts:
+                update["attributes"].update(self._compute_settings(new))
+            if "drone" in parts:
+                update["attributes"].update(self._compute_drone_settings(new))
+            if any(section in parts for section in CONTOUR_SECTIONS):
+                # draw the sections in the same order as `_instantiate`,
+                # so that unchanged values give the same contours
+                rng = np.random.RandomState(new["values"]["seed"])
+                for section in CONTOUR_SECTIONS:
+                    contours = self._compute_contours(section, new, rng)
+                    if section in parts:
+                        update["contours"].update(contours)
+            if "controls" in parts:
+                update["controls"] = list(new["control_2_contour"])
+
+            self._target_config = new
+            self._pending_reconfigurations.put(update)
+
+        return parts
+
+    def _apply_reconfiguration(self, update: dict) -> None:
+        """
+        Swap in a configuration prepared by `reconfigure`.
+
+        :param update: the prepared configuration, parameters and contours.
+        """
+        if update["config"]["drone"] != self._config["drone"]:
+            # stop the sounding drones with the settings they were played with
+            self._released_drones.extend(self.release_drones())
+        self._config = update["config"]
+        self.__dict__.update(update["attributes"])
+        # recorded states no longer match the new configuration
+        self._checkpoints = {}
+
+        # keep the new contours at the current position
+        for contour_name, contour in update["contours"].items():
+            contour._index = self._contours[contour_name]._index
+            self._contours[contour_name] = contour
+
+        if "controls" in update:
+            new_names = [
+                name for name in update["controls"] if name not in self._contour_values
+            ]
+            if len(new_names) != 0:
+                # publish a new control state including the new controls
+                for name in new_names:
+                    self._contour_values[name] = 0.5
+                self._controls = cs.ControlState(
+                    {**self._contour_values, "external_tempo": self._external_tempo}
+                )
+                self._controls_generation = self._controls.generation
+
     def check_midi_control(self) -> Callable[[], None]:
         """
         Returns a function that associates a contour name (values) for every MIDI control number in the dictionary (keys) and updates the groover accordingly.
@@ -401,7 +749,7 @@ class Groover:
                     value = msg.value / 127
                     self.set_contour_value(contour_name, value)
                     # print(f'"\x1B[0K"{contour_name}:\t{round(value, 2)}', end="\r")
-                    print(f"{contour_name}:\t{round(value, 2)}")
+                    log.info("control", "%s:\t%.2f", contour_name, value)
 
         return callback
 
@@ -410,10 +758,19 @@ class Groover:
         Retrieve the next value of each contour and store it for future use.
         """
 
-        with self._note_index_lock:
-            # update all contours
-            for contour_name in self._contours:
-                self._contour_values[contour_name] = self._contours[contour_name].next()
+        # read a consistent snapshot of the live controls
+        generation, values = self._controls.snapshot()
+        if generation != self._controls_generation:
+            self._controls_generation = generation
+            for name, value in zip(self._controls.names, values):
+                if name == "external_tempo":
+                    self._external_tempo = value
+                else:
+                    self._contour_values[name] = value
+
+        # update all contours
+        for contour_name in self._contours:
+            self._contour_values[contour_name] = self._contours[contour_name].next()
 
         # add the human part
         for contour_name in ["velocity", "tempo", "ornament"]:
@@ -433,6 +790,7 @@ class Groover:
     def set_contour_value(self, contour_name: str, value: float) -> None:
         """
         Set the value of a given contour to a given value until the update.
+        The value is published without blocking and is read by the playback thread at the next note.
 
         :param contour_name: the name of the contour.
         :param value: the value to set the contour to.
@@ -443,7 +801,7 @@ class Groover:
         if contour_name not in self._contour_values:
             raise UnknownContourError
 
-        self._contour_values[contour_name] = value
+        self._controls.write({contour_name: value})
 
     '''
     def has_next(self):
@@ -459,34 +817,153 @@ class Groover:
         Return the current event in the tune. Returns none if no event is available.
         """
 
-        with self._note_index_lock:
-            self._note_index += 1
-            if self._note_index >= len(self._tune):
-                return None
-            note = self._tune[self._note_index]
-            # update performance time
-            self._performance_time += note.time
-            return note
+        # record the state after each song position is performed
+        if self._note_index >= 0:
+            current = self._tune[self._note_index]
+            if current.type == "songpos" and current.pos not in self._checkpoints:
+                self._checkpoints[current.pos] = self._checkpoint()
+
+        # apply jumps requested by other threads
+        while not self._pending_jumps.empty():
+            self._jump(self._pending_jumps.get_nowait())
+
+        self._note_index += 1
+        if self._note_index >= len(self._tune):
+            return None
+        note = self._tune[self._note_index]
+
+        # apply configuration changes before a note starts
+        # so that no note is left sounding with outdated settings
+        if lu.is_note_on(note):
+            while not self._pending_reconfigurations.empty():
+                self._apply_reconfiguration(self._pending_reconfigurations.get_nowait())
+        # update performance time
+        self._performance_time += note.time
+        return note
 
     def jump_to_pos(self, pos: int) -> None:
         """
         Jump to the specified song position.
+        The jump is applied by the playback thread before retrieving the next event.
 
         :param pos: the position to jump to.
         """
 
-        with self._note_index_lock:
-            if pos > self._tune._max_songpos:
-                print(
-                    f"Cannot jump to position {pos} with max pos {self._tune._max_songpos}"
-                )
-                return
-            self._note_index, contour_index = self._tune.index_map[pos]
-            # update performance time
-            self._performance_time = self._tune.duration_map[pos]
-            # update all contours
-            for contour_name in self._contours:
-                self._contours[contour_name].jump(contour_index - 1)
+        if pos > self._tune._max_songpos:
+            log.warning(
+                "sync",
+                "Cannot jump to position %d with max pos %d",
+                pos,
+                self._tune._max_songpos,
+            )
+            return
+        self._pending_jumps.put(pos)
+
+    def _jump(self, pos: int) -> None:
+        """
+        Move the note index and all contours to the specified song position.
+        If a checkpoint was recorded for the position, the whole performance state is restored, so that the performance continues exactly as it did the first time.
+
+        :param pos: the position to jump to.
+        """
+        self._note_index, contour_index = self._tune.index_map[pos]
+        # update performance time
+        self._performance_time = self._tune.duration_map[pos]
+
+        if pos in self._checkpoints:
+            self._restore(self._checkpoints[pos])
+            return
+
+        # update all contours
+        for contour_name in self._contours:
+            self._contours[contour_name].jump(contour_index - 1)
+
+    def _checkpoint(
+        self, random_state: tuple = None, np_random_state: tuple = None
+    ) -> dict:
+        """
+        Capture the performance state that is not determined by the song position.
+        Live control values are not part of the state.
+
+        :param random_state: the state of the python random generator. If None, the state of the global generator.
+        :param np_random_state: the state of the numpy random generator. If None, the state of the global generator.
+
+        :return: the captured state.
+        """
+        if random_state is None:
+            random_state = random.getstate()
+        if np_random_state is None:
+            np_random_state = np.random.get_state()
+        version, internal_state, gauss_next = random_state
+        return {
+            "offset": self._offset,
+            "delay": self._delay,
+            "pitch_errors": dict(self._pitch_errors),
+            "did_swing": self._did_swing,
+            "last_played_drones": list(self._last_played_drones),
+            "tempo": self._tempo,
+            "contour_index": next(iter(self._contours.values()))._index,
+            "contour_values": {name: self._contour_values[name] for name in self._contours},
+            # store the random states as arrays to keep checkpoints compact
+            "random_state": (
+                version,
+                np.array(internal_state, dtype=np.uint32),
+                gauss_next,
+            ),
+            "np_random_state": np_random_state,
+        }
+
+    def _restore(self, checkpoint: dict) -> None:
+        """
+        Restore a performance state captured with `_checkpoint`.
+
+        :param checkpoint: the captured state.
+        """
+        self._offset = checkpoint["offset"]
+        self._delay = checkpoint["delay"]
+        self._pitch_errors = defaultdict(int, checkpoint["pitch_errors"])
+        self._did_swing = checkpoint["did_swing"]
+        self._last_played_drones = list(checkpoint["last_played_drones"])
+        self._tempo = checkpoint["tempo"]
+        for contour_name in self._contours:
+            self._contours[contour_name].jump(checkpoint["contour_index"])
+        self._contour_values.update(checkpoint["contour_values"])
+
+        version, internal_state, gauss_next = checkpoint["random_state"]
+        random.setstate((version, tuple(internal_state.tolist()), gauss_next))
+        np.random.set_state(checkpoint["np_random_state"])
+
+    def seed_random(self) -> None:
+        """
+        Set the global random generators, which the performance draws from, to their state at the start of the performance.
+        """
+        version, internal_state, gauss_next = self._start_checkpoint["random_state"]
+        random.setstate((version, tuple(internal_state.tolist()), gauss_next))
+        np.random.set_state(self._start_checkpoint["np_random_state"])
+
+    def compute_checkpoints(self) -> None:
+        """
+        Record a checkpoint for every song position with a silent performance of the whole tune from the start, using the current control values.
+        The state of the groover is left unchanged.
+        """
+        note_index = self._note_index
+        performance_time = self._performance_time
+        current = self._checkpoint()
+
+        self._restore(self._start_checkpoint)
+        self._note_index = -1
+        self._performance_time = -self._tune.offset
+        self._checkpoints = {}
+        while True:
+            message = self.next_event()
+            if message is None:
+                break
+            if message.type != "sysex":
+                self.perform(message)
+
+        self._note_index = note_index
+        self._performance_time = performance_time
+        self._restore(current)
 
     def reset_clock(self) -> None:
         """
@@ -494,8 +971,7 @@ class Groover:
         """
 
         self._last_clock_time = None
-        with self._tempo_lock:
-            self._external_tempo = None
+        self._controls.write({"external_tempo": None})
 
     def set_tempo(self, tempo: int) -> None:
         """
@@ -503,14 +979,16 @@ class Groover:
 
         :param tempo: the requested tempo in bpms.
         """
-        with self._tempo_lock:
-            self._external_tempo = mido.bpm2tempo(tempo)
+        self._controls.write({"external_tempo": mido.bpm2tempo(tempo)})
 
-    def set_clock(self) -> None:
+    def set_clock(self, now: float = None) -> None:
         """
         Register a MIDI clock message and calculate the requested tempo.
+
+        :param now: the time the clock message was received in seconds, e.g. when replaying recorded messages. If None, the current time.
         """
-        now = time.time()
+        if now is None:
+            now = time.time()
         if self._last_clock_time is not None:
             # update tempo
             # 24 clocks per quarter note
@@ -521,8 +999,7 @@ class Groover:
             if new_tempo > lu.MAX_TEMPO:
                 new_tempo = None
 
-            with self._tempo_lock:
-                self._external_tempo = new_tempo
+            self._controls.write({"external_tempo": new_tempo})
         self._last_clock_time = now
 
     def perform(self, message: mido.Message) -> list[mido.Message]:
@@ -663,8 +1140,249 @@ class Groover:
             notes = self._add_drone(notes, drone, is_note_on)
 
         # print("done")
+        if len(self._released_drones) != 0:
+            notes = self._released_drones + notes
+            self._released_drones = []
         return notes
 
+    def render(self) -> list[mido.Message]:
+        """
+        Render the whole tune offline, without live control input or synchronization.
+        Velocities, legato, tempo scaling, swing offsets and pitch bends are computed for the whole tune as array operations, then the final event stream is emitted in a single pass.
+        Ornaments and drones follow the same rules as `perform`, but random draws are batched, so a given seed will not reproduce the real-time performance message by message.
+
+        :return: the list of midi messages corresponding to the performance of the whole tune.
+        """
+
+        # the whole tune is rendered with the latest configuration
+        while not self._pending_reconfigurations.empty():
+            self._apply_reconfiguration(self._pending_reconfigurations.get_nowait())
+
+        events = [self._tune[i] for i in range(len(self._tune))]
+
+        # performance time and contour index of each event
+        times = np.array([e.time for e in events], dtype=float)
+        performance_times = np.cumsum(times) - self._tune.offset
+        note_ons = np.array([lu.is_note_on(e) for e in events])
+        # index 0 holds the values before the first note
+        contour_indexes = np.cumsum(note_ons)
+
+        # contour values with the human part
+        # the human part stays constant since there is no live input
+        values = {}
+        for contour_name in self._contours:
+            values[contour_name] = np.concatenate(
+                (
+                    [self._contour_values[contour_name]],
+                    self._contours[contour_name]._contour,
+                )
+            ).astype(float)
+
+        for contour_name in ["velocity", "tempo", "ornament"]:
+            hi = (
+                self._contour_values[f"{contour_name}_human_impact"]
+                * self._config[contour_name]["human_impact_scale"]
+            )
+
+            intensity = self._contour_values[f"{contour_name}_intensity"]
+            if self._config[contour_name]["human_impact_scale"] < 0:
+                intensity = 1 - intensity
+                hi = abs(hi)
+
+            values[contour_name][1:] *= 1 - hi
+            values[contour_name][1:] += hi * intensity
+
+        # on a beat
+        beat_positions = (
+            performance_times % self._tune._bar_duration
+        ) / self._tune._beat_duration
+        on_beat = abs(beat_positions - np.round(beat_positions)) <= lu.TRIGGER_DELTA
+        note_on_beat = np.concatenate(([False], on_beat[note_ons]))
+
+        # velocities
+        max_velocity = self._config["values"]["max_velocity"]
+        min_velocity = self._config["values"]["min_velocity"]
+        velocities = values["velocity"] * (max_velocity - min_velocity)
+        velocities += note_on_beat * self._config["values"]["beat_velocity_increase"]
+        velocities *= values["velocity_pattern"]
+        velocities = np.clip(velocities, min_velocity, max_velocity).astype(int).tolist()
+
+        # tempo
+        base_tempo = self._user_tempo
+        if self._external_tempo is not None:
+            base_tempo = self._external_tempo
+        if self._config["tempo_control"]["use_old_tempo_warp"]:
+            tempo_warp = self._config["tempo_control"]["old_tempo_warp"]
+            tempi = np.trunc(
+                2 * tempo_warp * base_tempo * (values["tempo"] - 0.5)
+            ).astype(int)
+            tempi += self._user_tempo
+        else:
+            bpm = max(mido.tempo2bpm(base_tempo), 1)
+            bpms = np.trunc(
+                bpm
+                + 2
+                * self._config["tempo_control"]["tempo_warp_bpms"]
+                * (values["tempo"] - 0.5)
+            )
+            tempi = np.round(60 * 1e6 / bpms).astype(int)
+        if self._config["tempo_control"]["increasing"]:
+            tempi = np.minimum.accumulate(np.minimum(tempi, self._tempo))
+        tempo_ratios = (tempi / self._tune.tempo).tolist()
+        tempi = tempi.tolist()
+
+        # legato
+        legato = (
+            self._config["values"]["legato_min"]
+            + self._legato_amount * values["phrasing"]
+        )
+
+        # swing
+        s1 = self._config["swing"]["min"]
+        s2 = self._config["swing"]["max"]
+        swing_perc = values[self._config["swing"]["bind"]]
+        p = s1 * (1 - swing_perc) + s2 * swing_perc
+        u = 0.125
+        x = np.concatenate(
+            ([0], 0.25 * performance_times[note_ons] / self._tune.quarter_duration)
+        )
+        d = (values["message length"] / self._tune.quarter_duration) * 0.25
+        swing_it = (abs((x % (2 * u)) - u) < 0.012) & (d - u > -0.012)
+        swing_amount = 4 * 2 * u * ((p / (p + 1)) - 0.5) * self._tune.quarter_duration
+
+        # contour information as MIDI CC
+        control_values = {
+            contour_name: np.round(values[contour_name] * 127).astype(int).tolist()
+            for contour_name in self._config["contour_2_control"]
+        }
+
+        # pitch bends, drawn in chunks since ornaments add notes
+        bend_scale = self._config["values"]["pitch_deviation_cents"] * 0.01 * 8192
+        bends = []
+
+        performance_times = performance_times.tolist()
+        note_ons = note_ons.tolist()
+        contour_indexes = contour_indexes.tolist()
+        performance = self._released_drones
+        self._released_drones = []
+        for i, message in enumerate(events):
+            self._note_index = i
+            self._performance_time = performance_times[i]
+
+            # repetition markers are not performed
+            if message.type == "sysex":
+                continue
+
+            new_message = message.copy()
+            k = contour_indexes[i]
+
+            is_note_on = note_ons[i]
+            if is_note_on:
+                # advance the contours
+                for contour_name in self._contours:
+                    self._contours[contour_name]._index = k - 1
+                    self._contour_values[contour_name] = values[contour_name][k]
+
+            # change note duration
+            should_skip = self._offset > new_message.time + lu.TRIGGER_DELTA
+            removable_offset = min(new_message.time, self._offset)
+            new_message.time -= removable_offset
+            self._offset -= removable_offset
+
+            if should_skip:
+                continue
+
+            # warp note duration according to contour
+            new_message.time *= values["tempo_pattern"][k]
+
+            # change midi channel
+            if lu.is_note(new_message):
+                new_message.channel = self._midi_channel
+
+            if lu.is_note_off(new_message):
+                new_length = new_message.time * legato[k]
+                self._delay = new_message.time - new_length
+                new_message.time = new_length
+
+                # change note offs of errors
+                key = new_message.note
+                if key in self._pitch_errors:
+                    new_message.note += self._pitch_errors[key]
+                    del self._pitch_errors[key]
+
+            if is_note_on:
+                new_message.velocity = velocities[k]
+                new_message.time += self._delay
+
+                # apply swing
+                if swing_it[k]:
+                    self._offset += swing_amount[k]
+                    self._did_swing = True
+                elif self._did_swing:
+                    self._offset -= swing_amount[k]
+                    self._did_swing = False
+
+            notes = [
+                mido.Message(
+                    "control_change",
+                    channel=self._config["values"]["midi_channel"],
+                    control=self._config["contour_2_control"][contour_name],
+                    value=control_values[contour_name][k],
+                    time=0,
+                )
+                for contour_name in control_values
+            ]
+
+            if not self._syncing:
+                notes.append(mido.MetaMessage("set_tempo", tempo=tempi[k], time=0))
+
+            notes_to_add = [new_message]
+            if is_note_on and self.can_generate_ornament():
+                ornament_type = self.choose_ornament(new_message)
+                if ornament_type is not None:
+                    notes_to_add = self.generate_ornament(new_message, ornament_type)
+            notes.extend(notes_to_add)
+
+            # scale things according to tempo
+            new_notes = []
+            for note in notes:
+                note.time = tempo_ratios[k] * max(0, note.time)
+
+                if lu.is_note(note):
+                    note.note += self._transpose_semitones
+
+                if lu.is_note_on(note):
+                    if len(bends) == 0:
+                        bends = list(
+                            (
+                                bend_scale
+                                * np.random.normal(loc=0, scale=0.33, size=len(events))
+                            )
+                            .astype(int)
+                            .tolist()
+                        )
+                    new_notes.append(
+                        mido.Message(
+                            "pitchwheel", channel=note.channel, pitch=bends.pop()
+                        )
+                    )
+                new_notes.append(note)
+            notes = new_notes
+
+            # add drone
+            if lu.is_note(new_message) and self._config["drone"]["active"]:
+                drone = []
+                if self._contour_values[self._drone_bound_contour] >= self._drone_threshold:
+                    drone = self._get_drone(new_message.note)
+
+                notes = self._add_drone(notes, drone, is_note_on)
+
+            performance.extend(notes)
+
+        self._tempo = int(tempi[-1])
+
+        return performance
+
     def _apply_swing(self) -> float:
         """
         Apply a p:1 swing by offsetting the start time of the next note, where p is user defined.  e.g. p=1: straight eight notes; p=2: triplet swing.
@@ -764,75 +1482,41 @@ class Groover:
         return notes
 
     def _get_drone(self, reference: int) -> np.array:
-        # figure out what note is allowed depending on harmony
-        harmony = self._contour_values["harmony"]
-        if not self._config["drone"]["transpose"]:
-            harmony += self._transpose_semitones
-
-        harmony = int(harmony % 12)
-
-        # check on what string the note could be played
-        distances = reference - self._drone_notes
-        distances[distances < 0] = 127
-        string = np.argmin(distances)
-        index = []
-
-        # add lower string if there
-        if string > 0:
-            index.append(string - 1)
-
-        # add upper string if there
-        if string < len(self._drone_notes) - 1:
-            index.append(string + 1)
-
-        allowed_harmony = lu.get_chord_pitches(int(self._contour_values["harmony"]))
-
-        # append root
-        if self._config["drone"]["allow_root"]:
-            allowed_harmony = np.append(
-                allowed_harmony,
-                (24 + self._tune.root + self._transpose_semitones - harmony) % 12,
-            )
+        """
+        Return the drone notes to play with a note, looking them up in the precomputed table when possible.
 
-        index = np.array(index)
-        index = index[
-            np.in1d((12 + self._drone_notes[index] - harmony) % 12, allowed_harmony)
-        ]
+        :param reference: the note to drone.
 
-        free_index = np.arange(len(self._free_drone_notes))
-        free_index = free_index[
-            np.in1d(
-                (12 + self._free_drone_notes - harmony) % 12,
-                allowed_harmony,
+        :return: the drone notes.
+        """
+        harmony = self._contour_values["harmony"]
+        if (
+            self._drone_table is not None
+            and harmony == int(harmony)
+            and 0 <= harmony < HARMONY_CODES
+            and 0 <= reference < 128
+        ):
+            return self._drone_table[reference, int(harmony)]
+        return compute_drone(reference, harmony, *self._drone_args)
+
+    def release_drones(self) -> list[mido.Message]:
+        """
+        Stop the drone notes being played, e.g. before another tune starts.
+
+        :return: the note off messages of the drone notes.
+        """
+        notes = [
+            mido.Message(
+                type="note_off",
+                channel=self._config["drone"]["midi_channel"],
+                note=drone,
+                velocity=0,
+                time=0,
             )
+            for drone in self._last_played_drones
         ]
-
-        drone = np.array([-1]).astype(int)
-
-        if len(index) != 0:
-            drone_notes = self._drone_notes[index]
-            index = np.argsort(abs(drone_notes - reference))
-            drone = np.concatenate(
-                (
-                    drone,
-                    drone_notes[
-                        index[: self._config["drone"]["strings_at_once"]]
-                    ].astype(int),
-                )
-            )
-
-        if len(free_index) != 0:
-            free_drone_notes = self._free_drone_notes[free_index]
-            drone = np.concatenate(
-                (
-                    drone,
-                    free_drone_notes[
-                        : self._config["drone"]["free_strings_at_once"]
-                    ].astype(int),
-                )
-            )
-
-        return drone[1:]
+        self._last_played_drones = []
+        return notes
 
     def get_end_notes(self) -> list[mido.Message]:
         """
@@ -958,11 +1642,10 @@ class Groover:
 
         :return: the note used the approach the given note from above.
         """
-        note_name = m21.pitch.Pitch(midi=note_number).nameWithOctave
+        note_name = lu.midi_to_note_name(note_number)
         # use configuration
         if note_name in self._config["approach_from_above"]:
-            pitch = m21.pitch.Pitch(self._config["approach_from_above"][note_name])
-            return pitch.midi
+            return lu.note_name_to_midi(self._config["approach_from_above"][note_name])
         # use normal scale
         else:
             index = self._tune.semitones_from_tonic(
@@ -980,11 +1663,10 @@ class Groover:
 
         :return: the note used the approach the given note from below.
         """
-        note_name = m21.pitch.Pitch(midi=note_number).nameWithOctave
+        note_name = lu.midi_to_note_name(note_number)
         # use configuration
         if note_name in self._config["approach_from_below"]:
-            pitch = m21.pitch.Pitch(self._config["approach_from_below"][note_name])
-            return pitch.midi
+            return lu.note_name_to_midi(self._config["approach_from_below"][note_name])
         # use normal scale
         else:
             index = self._tune.semitones_from_tonic(note_number)
@@ -1002,7 +1684,7 @@ class Groover:
         :return: the list of midi events corresponding to the chosen ornament.
         """
 
-        print(ornament_type)
+        log.debug("ornament", ornament_type)
         ornaments = []
         if self._config["values"]["use_old_ornaments"]:
             message_length = self._contour_values["message length"]
@@ -1136,7 +1818,6 @@ class Groover:
 
                 # calculate pitch bend
                 diff = self.approach_from_below(message.note, self._tune) - message.note
-                bend = max(min(4096.0 * diff, 8191), -8192)
 
                 # calculate duration
                 resolution = self._config["values"]["bend_resolution"]
@@ -1146,11 +1827,7 @@ class Groover:
 
                 # append messages
                 mult = random.uniform(0.25, 0.5)
-                for i in range(resolution, -1, -1):
-                    p = i / resolution
-                    p **= mult
-                    p *= bend
-                    p = int(p)
+                for p in get_bend_curve(resolution, diff, mult):
                     ornaments.append(
                         mido.Message(
                             "pitchwheel",
@@ -1201,6 +1878,7 @@ class Groover:
                 off_message = mido.Message(
                     "note_off",
                     note=new_message.note,
+                    channel=new_message.channel,
                     velocity=0,
                     time=message_length * perc,
                 )
@@ -1275,6 +1953,7 @@ class Groover:
                         mido.Message(
                             "note_on",
                             note=new_pitch,
+                            channel=message.channel,
                             velocity=min(
                                 self._config["values"]["max_velocity"],
                                 max(
@@ -1290,19 +1969,13 @@ class Groover:
                 # add slide if necessary
                 diff = new_note - first_note
                 if diff != 0 and self._config["ornamentation"][ornament_type]["slide"]:
-                    bend = max(min(4096.0 * diff, 8191), -8192)
-
                     # calculate duration
                     resolution = self._config["values"]["bend_resolution"]
                     duration = overall_duration / resolution
 
                     # append messages
                     mult = random.uniform(0.25, 0.5)
-                    for i in range(resolution, -1, -1):
-                        pb = i / resolution
-                        pb **= mult
-                        pb *= bend
-                        pb = int(pb)
+                    for pb in get_bend_curve(resolution, diff, mult):
                         ornaments.append(
                             mido.Message(
                                 "pitchwheel",
@@ -1311,7 +1984,7 @@ class Groover:
                                 time=duration,
                             )
                         )
-                        overall_duration -= duration
+                    overall_duration -= duration * (resolution + 1)
 
                 # add a note off message if not sliding
                 # or if sliding and last message
@@ -1323,6 +1996,7 @@ class Groover:
                         mido.Message(
                             "note_off",
                             note=new_pitch,
+                            channel=message.channel,
                             time=overall_duration,
                         )
                     )
@@ -1497,9 +2171,8 @@ class Groover:
         """
         Reset all contours so that the next call to `next()` will yield the first value of each contour.
         """
-        with self._note_index_lock:
-            for contour_name in self._contours:
-                self._contours[contour_name].reset()
+        for contour_name in self._contours:
+            self._contours[contour_name].reset()
 
     def _is_on_a_beat(self) -> bool:
         """
@@ -1523,9 +2196,8 @@ class Groover:
 
         calculated_tempo = None
         base_tempo = self._user_tempo
-        with self._tempo_lock:
-            if self._external_tempo is not None:
-                base_tempo = self._external_tempo
+        if self._external_tempo is not None:
+            base_tempo = self._external_tempo
 
         # (old) version 1
         # warp as a percentage of current tempo
@@ -6,6 +6,8 @@ import math
 import time
 import numpy as np
 
+import loeric.loeric_utils as lu
+
 
 class PlayerThread:
     def __init__(self, port_num, control_num, invert):
@@ -207,8 +209,17 @@ def main():
     parser.add_argument(
         "--invert", action="store_true", help="whether to invert the signal or not"
     )
+    parser.add_argument(
+        "--profile-startup",
+        help="print how long importing the listener and its dependencies takes and exit.",
+        action="store_true",
+    )
     args = parser.parse_args()
 
+    if args.profile_startup:
+        lu.profile_startup("loeric.listeners.playalong", deferred=[])
+        return
+
     if args.list:
         p = pyaudio.PyAudio()
         info = p.get_host_api_info_by_index(0)
@@ -5,6 +5,51 @@ import json
 import os
 
 
+PERFORMANCE_FOLDERS = ["tune_type", "instrument", "drone", "ornament", "control"]
+
+
+def merge_config(
+    base: dict, dir_path: str, folders: list[str], options: dict
+) -> tuple[dict, list[str]]:
+    """
+    Merge the selected configuration files on top of a base configuration.
+
+    :param base: the base configuration.
+    :param dir_path: the directory containing one subfolder per configuration category.
+    :param folders: the configuration categories to consider.
+    :param options: a dictionary holding, for each category, the names of the selected configuration files separated by "-" (or None to skip the category).
+
+    :return: a tuple (configuration, names) containing the merged configuration and the names of the selected options.
+    """
+    config_name = []
+    for a in folders:
+        if options.get(a) is None:
+            continue
+        else:
+            for option in options[a].split("-"):
+                name = f"{dir_path}/{a}/{option}.json"
+                print("Using", f"{a}/{option}.json")
+                config_name.append(options[a])
+                with open(name, "r") as f:
+                    selected = json.load(f)
+                    base = jsonmerge.merge(base, selected)
+    return base, config_name
+
+
+def performance_config(options: dict) -> dict:
+    """
+    Build a performance configuration from the base configuration and the selected options, as done by `loeric-config`.
+
+    :param options: a dictionary holding, for each category in `PERFORMANCE_FOLDERS`, the names of the selected configuration files separated by "-".
+
+    :return: the merged configuration.
+    """
+    dir_path = os.path.dirname(os.path.realpath(__file__)) + "/performance"
+    with open(f"{dir_path}/base.json", "r") as f:
+        base = json.load(f)
+    return merge_config(base, dir_path, PERFORMANCE_FOLDERS, options)[0]
+
+
 def main():
     dir_path = os.path.dirname(os.path.realpath(__file__))
 
@@ -38,32 +83,16 @@ def main():
     if args["shell"]:
         folders = []
     else:
-        folders = ["tune_type", "instrument", "drone", "ornament", "control"]
+        folders = PERFORMANCE_FOLDERS
 
     # select files
-    config_name = []
-    for a in folders:
-        if args[a] is None:
-            continue
-        else:
-            for option in args[a].split("-"):
-                name = f"{dir_path}/{a}/{option}.json"
-                print("Using", f"{a}/{option}.json")
-                config_name.append(args[a])
-                with open(name, "r") as f:
-                    selected = json.load(f)
-                    base = jsonmerge.merge(base, selected)
+    base, _ = merge_config(base, dir_path, folders, args)
 
     # specific values for shell
     if args["shell"]:
         for name in ["switch_every", "sync_interval"]:
             base[name] = args[name]
 
-    if args["id"] is not None:
-        config_name.append(args[a])
-
-    config_name = "_".join(config_name) + ".json"
-
     if args["output"] is None:
         config_name = f"{dir_path}/config.json"
     else:
@@ -1,7 +1,7 @@
+import os
+import re
 import mido
-import muspy as mp
 import numpy as np
-import music21 as m21
 
 # how to approach a note from above or below in a major scale
 above_approach_scale = [2, 1, 2, 1, 1, 2, 1, 2, 1, 2, 1, 1]
@@ -137,6 +137,43 @@ def is_contour_valid(msg: mido.Message) -> bool:
 '''
 
 
+# note names of the pitch classes, spelled as music21 does
+NOTE_NAMES = ["C", "C#", "D", "E-", "E", "F", "F#", "G", "G#", "A", "B-", "B"]
+# semitones of the natural notes from C
+NOTE_STEPS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+# step, accidentals (# or - or b) and optional octave
+NOTE_NAME_PATTERN = re.compile(r"([A-Ga-g])([#b-]*)(\d+)?")
+
+
+def midi_to_note_name(note_number: int) -> str:
+    """
+    Return the name of a MIDI note with its octave, spelled as music21's `Pitch.nameWithOctave`, e.g. 61 is C#4 and 70 is B-4.
+
+    :param note_number: the MIDI note number.
+
+    :return: the note name.
+    """
+    return f"{NOTE_NAMES[note_number % 12]}{note_number // 12 - 1}"
+
+
+def note_name_to_midi(note_name: str) -> int:
+    """
+    Return the MIDI number of a note name, parsed as music21's `Pitch`: sharps are written as #, flats as - or b, and the octave defaults to 4, e.g. "Bb" is 70.
+
+    :param note_name: the note name.
+
+    :return: the MIDI note number.
+    """
+    match = NOTE_NAME_PATTERN.fullmatch(note_name.strip())
+    if match is None:
+        raise ValueError(f"Invalid note name {note_name}.")
+
+    step, accidentals, octave = match.groups()
+    octave = 4 if octave is None else int(octave)
+    alter = accidentals.count("#") - len(accidentals.replace("#", ""))
+    return (octave + 1) * 12 + NOTE_STEPS[step.upper()] + alter
+
+
 def is_note_on(msg: mido.Message) -> bool:
     """
     Check if a midi event is to be considered a note-on event, that is:
@@ -249,6 +286,33 @@ def get_ports(
     return inport, outport
 
 
+def parse_route(spec: str) -> tuple[int, set[int], set[str]]:
+    """
+    Parse the description of an output route, in the form PORT[:FILTER].
+    The filter is a comma separated list of MIDI channels (from 1) and message types, e.g. "1:2" or "1:note_on,note_off".
+
+    :param spec: the route description.
+
+    :return: a tuple (port, channels, types) with the output port index, the 0-based channels and the message types routed to the port. Channels and types are None if not restricted.
+    """
+    port, _, route_filter = spec.partition(":")
+    channels, types = set(), set()
+    for item in route_filter.split(","):
+        item = item.strip()
+        if item == "":
+            continue
+        elif item.isdigit():
+            channels.add(int(item) - 1)
+        else:
+            types.add(item)
+
+    return (
+        int(port),
+        None if len(channels) == 0 else channels,
+        None if len(types) == 0 else types,
+    )
+
+
 def is_aligned_with(time: float, interval: float, threshold: float) -> bool:
     """
     Checks whether a given time position in the tune aligns with some subdivision using a given threshold.
@@ -262,3 +326,97 @@ def is_aligned_with(time: float, interval: float, threshold: float) -> bool:
 
     half_i = interval * 0.5
     return abs(((time - half_i) % interval) - half_i) <= threshold
+
+
+def get_output_path(
+    source: str,
+    seed: int,
+    loeric_id: str,
+    output_dir: str = None,
+    filename: str = None,
+) -> str:
+    """
+    Return the path of the file where a generated performance will be saved.
+    The output directory is created if it does not exist.
+
+    :param source: the path to the performed tune.
+    :param seed: the random seed of the performance.
+    :param loeric_id: the id of the LOERIC instance that generated the performance.
+    :param output_dir: the output directory. If None, the tune's directory is used.
+    :param filename: the output filename. If None, it is derived from the tune name, the seed and the instance id.
+
+    :return: the path to the output file.
+    """
+    name = os.path.splitext(os.path.basename(source))[0]
+    if output_dir is None:
+        dirname = os.path.dirname(source)
+    else:
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        dirname = output_dir
+
+    if filename is None:
+        filename = f"generated_{name}_{seed}_{loeric_id}.mid"
+    return f"{dirname}/{filename}"
+
+
+# dependencies imported at their first use rather than at startup
+DEFERRED_IMPORTS = ["muspy", "music21", "scipy.signal"]
+
+
+def profile_startup(module: str, deferred: list[str] = None, top: int = 8) -> None:
+    """
+    Print how long importing a module takes in a fresh interpreter, broken down by top level package, followed by the time taken by the deferred dependencies when they are first used.
+
+    :param module: the module to import, e.g. the module of an entry point.
+    :param deferred: the modules imported lazily. If None, DEFERRED_IMPORTS is used.
+    :param top: how many packages to list for each import.
+    """
+    import subprocess
+    import sys
+
+    if deferred is None:
+        deferred = DEFERRED_IMPORTS
+    targets = [module, *deferred]
+    code = "; ".join(f"import {m}" for m in targets)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+
+    # self time of each package, per target import
+    packages = {}
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, cumulative, name = line[len("import time:") :].split("|")
+        if not self_time.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_time)
+
+        if depth == 0 and name in targets and name not in totals:
+            totals[name] = (int(cumulative), packages)
+            packages = {}
+        elif depth == 0 and name == "site":
+            # interpreter startup
+            packages = {}
+
+    print("Import times:")
+    for name in targets:
+        if len(deferred) != 0 and name == deferred[0]:
+            print("Deferred until first use:")
+        if name not in totals:
+            # already imported by a previous target
+            print(f"{name}:\t0.0 ms")
+            continue
+        cumulative, breakdown = totals[name]
+        print(f"{name}:\t{cumulative / 1000:.1f} ms")
+        for package, self_time in sorted(
+            breakdown.items(), key=lambda x: x[1], reverse=True
+        )[:top]:
+            print(f"\t{package}:\t{self_time / 1000:.1f} ms")
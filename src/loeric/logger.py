@@ -0,0 +1,203 @@
+import atexit
+import queue
+import sys
+import threading
+import time
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {
+    "debug": DEBUG,
+    "info": INFO,
+    "warning": WARNING,
+    "error": ERROR,
+}
+
+# categories used across LOERIC
+CATEGORIES = ["main", "ornament", "control", "player", "sync", "shell"]
+
+
+class Logger:
+    """
+    A logger that never blocks the calling thread.
+    Records are put in a bounded queue and written by a background thread. If the queue is full, records are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        level: int = INFO,
+        categories: list[str] = None,
+        max_queue: int = 4096,
+        stream=None,
+    ):
+        """
+        Initialize the class.
+
+        :param level: the minimum level of the records to write.
+        :param categories: the categories of the records to write. If None, all categories are written.
+        :param max_queue: the maximum number of records waiting to be written.
+        :param stream: the stream to write to. If None, the standard output is used.
+        """
+        self._level = level
+        self._categories = None if categories is None else set(categories)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stream = stream
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def configure(self, level: int = None, categories: list[str] = None) -> None:
+        """
+        Change which records are written.
+
+        :param level: the minimum level of the records to write. If None, it is left unchanged.
+        :param categories: the categories of the records to write. If None, all categories are written.
+        """
+        if level is not None:
+            self._level = level
+        self._categories = None if categories is None else set(categories)
+
+    def is_enabled(self, category: str, level: int) -> bool:
+        """
+        :return: whether records with the given category and level would be written.
+        """
+        return level >= self._level and (
+            self._categories is None or category in self._categories
+        )
+
+    def log(self, category: str, level: int, message: str, *args) -> None:
+        """
+        Enqueue a record without blocking.
+        Formatting with `args` is deferred to the writer thread.
+
+        :param category: the category of the record.
+        :param level: the level of the record.
+        :param message: the message, optionally with %-style placeholders.
+        :param args: the values for the placeholders.
+        """
+        if not self.is_enabled(category, level):
+            return
+
+        if self._thread is None:
+            self._start()
+
+        try:
+            self._queue.put_nowait((time.time(), category, level, message, args))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        """
+        Start the writer thread.
+        """
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        """
+        Write records as they arrive, for as long as the program runs.
+        """
+        while True:
+            record = self._queue.get()
+            self._write(record)
+            self._queue.task_done()
+
+    def _write(self, record: tuple) -> None:
+        """
+        Format and write a single record.
+
+        :param record: the record to write.
+        """
+        _, category, level, message, args = record
+        if len(args) != 0:
+            message = message % args
+        if level != INFO:
+            name = [n for n, l in LEVELS.items() if l == level]
+            name = name[0].upper() if len(name) != 0 else str(level)
+            message = f"[{name}]\t{message}"
+
+        stream = sys.stdout if self._stream is None else self._stream
+        try:
+            stream.write(f"{message}\n")
+            stream.flush()
+        except Exception:
+            pass
+
+    def flush(self) -> None:
+        """
+        Wait until all enqueued records have been written, and report dropped records.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+        if self.dropped != 0:
+            print(f"[WARNING]\t{self.dropped} log records were dropped.")
+            self.dropped = 0
+
+
+# the logger shared by all modules
+_logger = Logger()
+
+
+def configure(level: int = None, categories: list[str] = None) -> None:
+    """
+    Change which records are written by the shared logger.
+
+    :param level: the minimum level of the records to write. If None, it is left unchanged.
+    :param categories: the categories of the records to write. If None, all categories are written.
+    """
+    _logger.configure(level, categories)
+
+
+def is_enabled(category: str, level: int) -> bool:
+    """
+    :return: whether the shared logger would write records with the given category and level.
+    """
+    return _logger.is_enabled(category, level)
+
+
+def log(category: str, level: int, message: str, *args) -> None:
+    """
+    Log a record with the shared logger without blocking.
+
+    :param category: the category of the record.
+    :param level: the level of the record.
+    :param message: the message, optionally with %-style placeholders.
+    :param args: the values for the placeholders.
+    """
+    _logger.log(category, level, message, *args)
+
+
+def debug(category: str, message: str, *args) -> None:
+    """
+    Log a debug record with the shared logger.
+    """
+    _logger.log(category, DEBUG, message, *args)
+
+
+def info(category: str, message: str, *args) -> None:
+    """
+    Log an info record with the shared logger.
+    """
+    _logger.log(category, INFO, message, *args)
+
+
+def warning(category: str, message: str, *args) -> None:
+    """
+    Log a warning record with the shared logger.
+    """
+    _logger.log(category, WARNING, message, *args)
+
+
+def flush() -> None:
+    """
+    Wait until all records of the shared logger have been written.
+    """
+    _logger.flush()
@@ -0,0 +1,177 @@
+import os
+import struct
+import time
+import mido
+
+from mido.midifiles.meta import encode_variable_int
+
+
+class MidiStreamWriter:
+    """
+    Writes a single-track midi file while the performance is played, instead of keeping it in memory.
+    Message times are converted to ticks as messages arrive, rounding the cumulative time so that rounding errors do not accumulate.
+    The encoded track is flushed to disk periodically and the track length in the file is updated at every flush, so that a partial recording is a valid midi file.
+    Optionally, the recording is split into a new file every given number of minutes of performance.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        tempo: int,
+        ticks_per_beat: int = 32767,
+        header: list[mido.MetaMessage] = None,
+        flush_interval: float = 1.0,
+        flush_size: int = 65536,
+        rotate_minutes: float = None,
+    ):
+        """
+        Initialize the class and create the first file.
+
+        :param path: the path to the output midi file. When rotating, the following files are suffixed with _001, _002, ...
+        :param tempo: the tempo used to convert seconds to ticks, in microseconds per quarter note.
+        :param ticks_per_beat: the resolution of the file.
+        :param header: the meta messages written at the start of every file, e.g. tempo and time signature.
+        :param flush_interval: the maximum time in seconds between two writes to disk.
+        :param flush_size: the maximum number of bytes kept in memory before writing to disk.
+        :param rotate_minutes: the duration of performance in minutes after which a new file is started. If None, a single file is written.
+        """
+        self._path = path
+        self._tempo = tempo
+        self._ticks_per_beat = ticks_per_beat
+        self._header = [] if header is None else header
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+        self._rotate_after = None if rotate_minutes is None else rotate_minutes * 60
+
+        # all the files written so far
+        self.paths = []
+        self._file = None
+        self._file_index = 0
+        self._open()
+
+    def _next_path(self) -> str:
+        """
+        :return: the path of the next file.
+        """
+        if self._file_index == 0:
+            return self._path
+        root, ext = os.path.splitext(self._path)
+        return f"{root}_{self._file_index:03d}{ext}"
+
+    def _open(self) -> None:
+        """
+        Start a new file and write its header.
+        """
+        path = self._next_path()
+        self._file_index += 1
+        self.paths.append(path)
+
+        self._file = open(path, "wb")
+        # format 0, one track
+        self._file.write(
+            b"MThd" + struct.pack(">LHHH", 6, 0, 1, self._ticks_per_beat)
+        )
+        self._length_position = self._file.tell() + 4
+        self._file.write(b"MTrk" + struct.pack(">L", 0))
+
+        self._track_length = 0
+        self._buffer = bytearray()
+        self._running_status = None
+        self._last_flush = time.monotonic()
+        # time of the file's start and of the last message, in seconds and ticks
+        self._seconds = 0.0
+        self._ticks = 0
+
+        for msg in self._header:
+            self._encode(msg, 0)
+
+    def _encode(self, msg: mido.Message, delta: int) -> None:
+        """
+        Encode a message as a track event.
+
+        :param msg: the message.
+        :param delta: the time since the previous event in ticks.
+        """
+        self._buffer.extend(encode_variable_int(delta))
+
+        if msg.is_meta:
+            self._buffer.extend(msg.bytes())
+            self._running_status = None
+        elif msg.type == "sysex":
+            self._buffer.append(0xF0)
+            # length (+ 1 for end byte (0xf7))
+            self._buffer.extend(encode_variable_int(len(msg.data) + 1))
+            self._buffer.extend(msg.data)
+            self._buffer.append(0xF7)
+            self._running_status = None
+        else:
+            msg_bytes = msg.bytes()
+            status = msg_bytes[0]
+            if status == self._running_status:
+                self._buffer.extend(msg_bytes[1:])
+            else:
+                self._buffer.extend(msg_bytes)
+            self._running_status = status if status < 0xF0 else None
+
+    def write(self, msg: mido.Message) -> None:
+        """
+        Append a message to the recording.
+
+        :param msg: the message, whose time is the time since the previous message in seconds.
+        """
+        if (
+            self._rotate_after is not None
+            and self._seconds + msg.time >= self._rotate_after
+        ):
+            # the remaining time is carried into the new file
+            remaining = self._seconds + msg.time - self._rotate_after
+            self._close_file()
+            self._open()
+            msg = msg.copy(time=remaining)
+
+        self._seconds += msg.time
+        # the track is ended once, on close
+        if msg.type == "end_of_track":
+            return
+
+        ticks = round(
+            mido.second2tick(self._seconds, self._ticks_per_beat, self._tempo)
+        )
+        self._encode(msg, ticks - self._ticks)
+        self._ticks = ticks
+
+        if (
+            len(self._buffer) >= self._flush_size
+            or time.monotonic() - self._last_flush >= self._flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered events to disk and update the track length.
+        """
+        self._file.write(self._buffer)
+        self._track_length += len(self._buffer)
+        self._buffer = bytearray()
+
+        end = self._file.tell()
+        self._file.seek(self._length_position)
+        self._file.write(struct.pack(">L", self._track_length))
+        self._file.seek(end)
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def _close_file(self) -> None:
+        """
+        End the track and close the current file.
+        """
+        self._encode(mido.MetaMessage("end_of_track"), 0)
+        self.flush()
+        self._file.close()
+
+    def close(self) -> None:
+        """
+        End the recording.
+        """
+        if self._file is not None and not self._file.closed:
+            self._close_file()
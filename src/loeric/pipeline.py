@@ -0,0 +1,117 @@
+import collections
+import threading
+import time
+import mido
+
+from collections.abc import Iterable
+
+from . import player as pl
+
+
+class Pipeline:
+    """
+    Generates a performance ahead of its playback.
+    A producer thread consumes the performance and stores its messages, timestamped on the playback timeline, in a bounded buffer, while the calling thread sends them on time through the player.
+    The producer only generates an event once the performance generated so far is at most `lookahead` seconds ahead of playback, measured on the clock since playback started, so live control changes are heard within that delay, and a slow event only delays playback if it takes longer than the lookahead.
+    """
+
+    def __init__(
+        self, player: pl.Player, lookahead: float = 0.1, max_size: int = 4096
+    ):
+        """
+        Initialize the class.
+
+        :param player: the player sending the messages. Its playback must be initialized.
+        :param lookahead: the maximum time in seconds by which the generated performance can be ahead of playback.
+        :param max_size: the number of buffered messages from which the producer waits before generating the next event.
+        """
+        self._player = player
+        self._lookahead = lookahead
+        self._max_size = max_size
+
+        self._buffer = collections.deque()
+        self._condition = threading.Condition()
+        # playback time of the last generated message
+        self._produced_time = 0.0
+        # clock time at which playback started
+        self._start_time = None
+        self._done = False
+        self._error = None
+
+    def _ahead(self) -> float:
+        """
+        :return: the time in seconds by which the generated performance is ahead of playback, measured on the clock since playback started.
+        """
+        return self._produced_time - (time.perf_counter() - self._start_time)
+
+    def _produce(
+        self, performance: Iterable[tuple[list[mido.Message], float]]
+    ) -> None:
+        """
+        Store the messages of the performance in the buffer.
+        Before generating each event, waits until the buffer is not full and the generated performance is at most `lookahead` seconds ahead of playback.
+
+        :param performance: the lists of messages to play, with delta times, and the time spent generating them.
+        """
+        try:
+            performance = iter(performance)
+            while True:
+                with self._condition:
+                    while True:
+                        if len(self._buffer) >= self._max_size:
+                            # woken up when a message is played
+                            self._condition.wait()
+                            continue
+                        ahead = self._ahead()
+                        if ahead <= self._lookahead:
+                            break
+                        self._condition.wait(ahead - self._lookahead)
+
+                # the event is only generated now
+                item = next(performance, None)
+                if item is None:
+                    break
+                messages, perform_time = item
+
+                with self._condition:
+                    for msg in messages:
+                        self._produced_time += msg.time
+                        self._buffer.append((msg, perform_time))
+                    self._condition.notify()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify()
+
+    def play(self, performance: Iterable[tuple[list[mido.Message], float]]) -> None:
+        """
+        Play a performance, generating it in a separate thread.
+        Returns when all the messages have been played.
+
+        :param performance: the lists of messages to play, with delta times, and the time spent generating them, e.g. a generator performing the tune event by event.
+
+        :raise Exception: any exception raised while generating the performance.
+        """
+        self._start_time = time.perf_counter()
+        producer = threading.Thread(
+            target=self._produce, args=(performance,), daemon=True
+        )
+        producer.start()
+
+        while True:
+            with self._condition:
+                while len(self._buffer) == 0 and not self._done:
+                    self._condition.wait()
+                if len(self._buffer) == 0:
+                    break
+                msg, perform_time = self._buffer.popleft()
+                self._condition.notify()
+
+            # waits until the message is due
+            self._player.play([msg], perform_time)
+
+        producer.join()
+        if self._error is not None:
+            raise self._error
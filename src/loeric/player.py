@@ -1,7 +1,337 @@
+import collections
+import threading
 import time
+import json
+import statistics
 import mido
-import music21 as m21
-import muspy as mp
+
+from typing import TYPE_CHECKING
+
+from . import logger as log
+from . import midi_writer as mw
+from . import timing as tm
+
+# only used for annotations, slow to import
+if TYPE_CHECKING:
+    import music21 as m21
+    import muspy as mp
+
+
+class ChangeFilter:
+    """
+    An output stage that drops control messages whose value did not change since the last one sent.
+    Control changes are tracked per (channel, controller), pitch bends per channel, tempo globally. Note messages are never dropped.
+    """
+
+    def __init__(
+        self,
+        cc_deadband: int = 0,
+        bend_deadband: int = 0,
+        tempo_deadband: float = 0,
+        max_rate: float = None,
+    ):
+        """
+        Initialize the class.
+
+        :param cc_deadband: control changes are dropped if their value differs from the last sent by at most this amount.
+        :param bend_deadband: pitch bends are dropped if their value differs from the last sent by at most this amount. A bend back to 0 is always sent.
+        :param tempo_deadband: tempo changes are dropped if they differ from the last sent by at most this amount of bpms.
+        :param max_rate: the maximum number of control, pitch bend and tempo messages per second. If None, no limit is enforced.
+        """
+        self._cc_deadband = cc_deadband
+        self._bend_deadband = bend_deadband
+        self._tempo_deadband = tempo_deadband
+        self._max_rate = max_rate
+        self.dropped = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget the last sent values, so that the next value of each control is always sent.
+        """
+        self._last_values = {}
+        self._tokens = self._max_rate
+        self._last_time = None
+
+    def _has_budget(self, now: float) -> bool:
+        """
+        Consume one message from the rate budget.
+
+        :param now: the current time in seconds.
+
+        :return: whether the budget allows one more message.
+        """
+        if self._max_rate is None:
+            return True
+
+        if self._last_time is not None:
+            self._tokens = min(
+                self._max_rate,
+                self._tokens + (now - self._last_time) * self._max_rate,
+            )
+        self._last_time = now
+
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def accept(self, msg: mido.Message, now: float) -> bool:
+        """
+        Decide whether a message should be sent, and record its value if so.
+
+        :param msg: the message to check.
+        :param now: the time at which the message is due, in seconds.
+
+        :return: True if the message should be sent.
+        """
+        if msg.type == "control_change":
+            key = (msg.channel, msg.control)
+            value = msg.value
+            deadband = self._cc_deadband
+        elif msg.type == "pitchwheel":
+            key = (msg.channel, "pitchwheel")
+            value = msg.pitch
+            deadband = self._bend_deadband
+            # always allow the bend to go back to rest
+            if value == 0:
+                deadband = -1
+        elif msg.type == "set_tempo":
+            key = "set_tempo"
+            value = mido.tempo2bpm(msg.tempo)
+            deadband = self._tempo_deadband
+        else:
+            return True
+
+        last = self._last_values.get(key)
+        if last is not None and abs(value - last) <= deadband:
+            self.dropped += 1
+            return False
+
+        if not self._has_budget(now):
+            self.dropped += 1
+            return False
+
+        self._last_values[key] = value
+        return True
+
+
+class ActiveNotes:
+    """
+    The notes sounding on each channel and the channels whose pitch is bent, as sent by a player.
+    Releasing them turns off exactly those notes and bends, instead of every note on every channel.
+    """
+
+    def __init__(self):
+        """
+        Initialize the class.
+        """
+        # the player updates the notes while they are released on exit
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget all the notes and bends.
+        """
+        with self._lock:
+            # channel -> sounding notes
+            self._notes = collections.defaultdict(set)
+            self._bent = set()
+
+    def update(self, msg: mido.Message) -> None:
+        """
+        Record a message sent to a port.
+
+        :param msg: the message.
+        """
+        if msg.type == "note_on" and msg.velocity > 0:
+            with self._lock:
+                self._notes[msg.channel].add(msg.note)
+        elif msg.type == "note_on" or msg.type == "note_off":
+            with self._lock:
+                self._notes[msg.channel].discard(msg.note)
+        elif msg.type == "pitchwheel":
+            with self._lock:
+                if msg.pitch == 0:
+                    self._bent.discard(msg.channel)
+                else:
+                    self._bent.add(msg.channel)
+
+    def release(self) -> list[mido.Message]:
+        """
+        Turn off the sounding notes and bring the bent channels back to rest, forgetting them.
+
+        :return: the note off and pitch bend messages to send.
+        """
+        with self._lock:
+            messages = [
+                mido.Message("note_off", channel=channel, note=note, velocity=0)
+                for channel in sorted(self._notes)
+                for note in sorted(self._notes[channel])
+            ]
+            messages += [
+                mido.Message("pitchwheel", channel=channel, pitch=0)
+                for channel in sorted(self._bent)
+            ]
+            self._notes.clear()
+            self._bent.clear()
+        return messages
+
+
+def load_latencies(path: str) -> dict[str, float]:
+    """
+    Load the output latencies measured for each MIDI port.
+    The file is a JSON dictionary mapping port names to their latency in milliseconds, either as a single value or as a list of measurements, whose median is used.
+
+    :param path: the path to the calibration file.
+
+    :return: the latency of each port in seconds.
+    """
+    with open(path, "r") as f:
+        measurements = json.load(f)
+
+    latencies = {}
+    for name, value in measurements.items():
+        if isinstance(value, list):
+            value = statistics.median(value)
+        latencies[name] = value / 1000
+    return latencies
+
+
+def get_latency(latencies: dict[str, float], port_name: str) -> float:
+    """
+    Find the latency of a port.
+    Names in the calibration match a port if they are equal to, or contained in, the port name, since port names often include a varying client number.
+
+    :param latencies: the latency of each port in seconds.
+    :param port_name: the name of the port.
+
+    :return: the latency of the port in seconds, 0 if the port is not calibrated.
+    """
+    if port_name in latencies:
+        return latencies[port_name]
+    for name, latency in latencies.items():
+        if name in port_name:
+            return latency
+    return 0.0
+
+
+def wait_until(due: float, spin_budget: float) -> None:
+    """
+    Wait until the given time, sleeping coarsely and then spinning for the last `spin_budget` seconds.
+
+    :param due: the time to wait for, on the `time.perf_counter` clock.
+    :param spin_budget: how long before the given time, in seconds, to stop sleeping and busy-wait.
+    """
+    remaining = due - time.perf_counter()
+    if remaining > spin_budget:
+        time.sleep(remaining - spin_budget)
+
+    # yield to other threads while spinning
+    while time.perf_counter() < due:
+        time.sleep(0)
+
+
+class PortSender:
+    """
+    Sends messages to an output port from a dedicated thread.
+    Messages are queued with the time they are due and sent in order, so that a slow or stalled port only delays its own messages.
+    The sender only accepts the messages on the given channels and of the given types.
+    """
+
+    def __init__(
+        self,
+        port,
+        channels: set[int] = None,
+        types: set[str] = None,
+        latency_offset: float = 0.0,
+        spin_budget: float = 0.001,
+    ):
+        """
+        Initialize the class and start the sender thread.
+
+        :param port: the output midi port.
+        :param channels: the 0-based channels of the messages sent to the port. Messages without a channel are only accepted by type. If None, any channel is accepted.
+        :param types: the types of the messages sent to the port. If None, any type is accepted.
+        :param latency_offset: the delay in seconds added to every message, to align the port with slower ones.
+        :param spin_budget: how long before a message is due, in seconds, the sender stops sleeping and busy-waits.
+        """
+        self.port = port
+        self._channels = channels
+        self._types = types
+        self.latency_offset = latency_offset
+        self._spin_budget = spin_budget
+        # when messages were due and sent, only updated by the sender thread
+        self.timing = tm.TimingStats(keep_records=False)
+
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def filtered(self) -> bool:
+        """
+        :return: whether the port only receives part of the messages.
+        """
+        return self._channels is not None or self._types is not None
+
+    def accepts(self, msg: mido.Message) -> bool:
+        """
+        :param msg: a message.
+
+        :return: whether the message is routed to this port.
+        """
+        if self._types is not None and msg.type in self._types:
+            return True
+        if self._channels is not None and hasattr(msg, "channel"):
+            return msg.channel in self._channels
+        return not self.filtered
+
+    def submit(self, due: float, msg: mido.Message) -> None:
+        """
+        Queue a message.
+
+        :param due: the time the message is due, on the `time.perf_counter` clock, without the latency offset.
+        :param msg: the message.
+        """
+        with self._condition:
+            self._queue.append((due + self.latency_offset, msg))
+            self._condition.notify()
+
+    def _run(self) -> None:
+        """
+        Send the queued messages when they are due, until the sender is closed.
+        """
+        while True:
+            with self._condition:
+                while len(self._queue) == 0 and not self._closed:
+                    self._condition.wait()
+                if len(self._queue) == 0:
+                    break
+                due, msg = self._queue.popleft()
+
+            wait_until(due, self._spin_budget)
+            self.port.send(msg)
+            self.timing.add(due, time.perf_counter())
+
+    def clear(self) -> None:
+        """
+        Drop the queued messages.
+        """
+        with self._condition:
+            self._queue.clear()
+
+    def close(self) -> None:
+        """
+        Send the queued messages and stop the sender thread. The port is left open.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
 
 
 class Player:
@@ -10,11 +340,20 @@ class Player:
     def __init__(
         self,
         tempo: int,
-        key_signature: mp.KeySignature,
-        time_signature: m21.meter.TimeSignature,
+        key_signature: "mp.KeySignature",
+        time_signature: "m21.meter.TimeSignature",
         save: bool,
         midi_out,
         verbose: bool = False,
+        message_filter: ChangeFilter = None,
+        spin_budget: float = 0.001,
+        latency: float = 0.0,
+        reference_latency: float = None,
+        save_path: str = None,
+        rotate_minutes: float = None,
+        timing: tm.TimingStats = None,
+        routes: list[PortSender] = None,
+        active_notes: ActiveNotes = None,
     ):
         """
         Initialize the class.
@@ -24,6 +363,16 @@ class Player:
         :param time_signature: the performance's time signature.
         :param save: whether or not to save the performance to a midi file
         :param midi_out: the output midi port.
+        :param verbose: whether or not to print every message played.
+        :param message_filter: the filter dropping unchanged control messages. If None, every message is played.
+        :param spin_budget: how long before a message is due, in seconds, the player stops sleeping and busy-waits instead. Sleeping alone can overshoot by up to a millisecond; spinning is exact but uses CPU. If 0, the player only sleeps.
+        :param latency: the output latency of the port in seconds, i.e. the time between sending a message and hearing it.
+        :param reference_latency: the latency, in seconds, that every port is aligned to. Messages are sent `reference_latency - latency` seconds after they are due, so that ports with different latencies sound together. If None, the port's own latency is used and messages are sent when due.
+        :param save_path: if given, the performance is written to this file while it is played instead of being kept in memory until `save`.
+        :param rotate_minutes: when writing while playing, start a new file every given number of minutes of performance. If None, a single file is written.
+        :param timing: where the timing of the messages sent is recorded. If None, a new one is created, which only keeps the summary statistics.
+        :param routes: additional output ports, each receiving the messages it accepts from its own thread. Messages accepted by a route with a channel or type filter are not sent to `midi_out`.
+        :param active_notes: where the notes and pitch bends sent are tracked. If None, a new one is created.
         """
         self._key_signature = key_signature
         self._time_signature = time_signature
@@ -31,7 +380,25 @@ class Player:
         self._midi_out = midi_out
         self._tempo = tempo
         self._verbose = verbose
+        self._filter = message_filter
+        self._spin_budget = spin_budget
+        if reference_latency is None:
+            reference_latency = latency
+        # delay compensating for the difference with the slowest port
+        self._latency_offset = max(reference_latency - latency, 0.0)
+        self._routes = [] if routes is None else routes
+        # the player waits for the earliest port, the others wait on their own
+        self._min_offset = min(
+            [self._latency_offset, *(r.latency_offset for r in self._routes)]
+        )
+        # when messages were due and sent
+        self.timing = tm.TimingStats(keep_records=False) if timing is None else timing
+        # notes and bends sent, released on stop
+        self.active_notes = ActiveNotes() if active_notes is None else active_notes
+        # time of dropped messages, to be added to the next saved one
+        self._dropped_time = 0.0
 
+        self._writer = None
         if self._saving:
             self._midi_performance = mido.MidiFile(type=0)
             self._midi_track = mido.MidiTrack()
@@ -51,6 +418,15 @@ class Player:
                 )
             )
 
+            if save_path is not None:
+                self._writer = mw.MidiStreamWriter(
+                    save_path,
+                    self._tempo,
+                    ticks_per_beat=self._midi_performance.ticks_per_beat,
+                    header=list(self._midi_track),
+                    rotate_minutes=rotate_minutes,
+                )
+
     def init_playback(self) -> None:
         """
         Initialize variables useful to keep track of playback time and avoid drifting.
@@ -59,15 +435,25 @@ class Player:
         # obtained from
         # mido/mido/midifiles/midifiles.py:423-424
         # to minimize drifting
-        self._start_time = time.time()
+        # the monotonic high resolution clock is not affected by system clock changes
+        self._start_time = time.perf_counter()
         self._input_time = 0.0
 
-    def play(self, messages: list[mido.Message]) -> None:
+    def _wait_until(self, due: float) -> None:
+        """
+        Wait until the given time, sleeping coarsely and then spinning for the last `spin_budget` seconds.
+
+        :param due: the time to wait for, on the `time.perf_counter` clock.
+        """
+        wait_until(due, self._spin_budget)
+
+    def play(self, messages: list[mido.Message], perform_time: float = None) -> None:
         """
         Play the messages in input and append them to the generated performance.
         If no midi port has been specified, the messages will only be saved.
 
         :param messages: the midi messages to play.
+        :param perform_time: the time in seconds spent generating the messages, recorded with their timing.
         """
 
         for msg in messages:
@@ -75,42 +461,109 @@ class Player:
             # obtained from
             # mido/mido/midifiles/midifiles.py:427-430
             self._input_time += msg.time
-            playback_time = time.time() - self._start_time
-            duration_to_next_event = self._input_time - playback_time
+
+            # skip unchanged values
+            if self._filter is not None and not self._filter.accept(
+                msg, self._input_time
+            ):
+                if self._saving:
+                    self._dropped_time += msg.time
+                continue
 
             if self._midi_out is not None:
                 if not msg.is_meta:
-                    # obtained from
-                    # mido/mido/midifiles/midifiles.py:432-433
-                    if duration_to_next_event > 0.0:
-                        time.sleep(duration_to_next_event)
-
                     # don't send songpos messages
                     # but do wait if between pauses
-                    if msg.type == "songpos":
-                        pass
-                    else:
+                    send = msg.type != "songpos"
+                    if send and len(self._routes) != 0:
+                        self._wait_until(
+                            self._start_time + self._input_time + self._min_offset
+                        )
+                        send = self._route(msg)
+
+                    scheduled = self._input_time + self._latency_offset
+                    self._wait_until(self._start_time + scheduled)
+                    self.timing.add(
+                        scheduled, time.perf_counter() - self._start_time, perform_time
+                    )
+
+                    if send:
                         self._midi_out.send(msg)
+                    self.active_notes.update(msg)
 
                     if self._verbose:
-                        print("[INFO]\t", msg)
+                        log.info("player", "[INFO]\t %s", msg)
 
             if self._saving:
-                self._midi_track.append(msg)
+                if self._dropped_time != 0:
+                    msg = msg.copy(time=msg.time + self._dropped_time)
+                    self._dropped_time = 0.0
+                if self._writer is not None:
+                    self._writer.write(msg)
+                else:
+                    self._midi_track.append(msg)
+
+    def _route(self, msg: mido.Message, due: float = None) -> bool:
+        """
+        Queue a message on the routes accepting it.
+
+        :param msg: the message.
+        :param due: the time the message is due, on the `time.perf_counter` clock. If None, the current playback time.
+
+        :return: whether the message should also be sent to the main output port, i.e. no route with a filter accepted it.
+        """
+        to_main = True
+        if due is None:
+            due = self._start_time + self._input_time
+        for route in self._routes:
+            if route.accepts(msg):
+                route.submit(due, msg)
+                if route.filtered:
+                    to_main = False
+        return to_main
+
+    def silence(self) -> None:
+        """
+        Turn off the sounding notes and reset the bent channels on the output ports, in a single burst.
+        The messages are sent right away and are not part of the saved performance.
+        """
+        if self._midi_out is None:
+            return
+        # due now on every route, whatever its latency offset
+        now = time.perf_counter() - max(
+            [0.0, *(route.latency_offset for route in self._routes)]
+        )
+        for msg in self.active_notes.release():
+            if len(self._routes) == 0 or self._route(msg, now):
+                self._midi_out.send(msg)
 
     def reset(self) -> None:
         """
-        Reset the output port.
+        Drop the messages queued on the routes and silence the output ports.
         """
-        if self._midi_out is not None:
-            self._midi_out.reset()
+        for route in self._routes:
+            route.clear()
+        self.silence()
+        if self._filter is not None:
+            self._filter.reset()
+
+    def close(self) -> None:
+        """
+        Wait for the messages queued on the routes to be sent and stop their threads.
+        """
+        for route in self._routes:
+            route.close()
 
     def save(self, filename: str) -> None:
         """
         Save the generated performance as a midi file.
 
-        :param filename: the path to the output midi file.
+        :param filename: the path to the output midi file. Ignored if the performance is written while playing, in which case the recording is ended.
         """
+        if self._writer is not None:
+            self._writer.close()
+            return
+
         for i, msg in enumerate(self._midi_performance.tracks[0]):
             self._midi_performance.tracks[0][i].time = round(
                 mido.second2tick(
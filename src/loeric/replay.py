@@ -0,0 +1,473 @@
+import argparse
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+import mido
+
+from collections.abc import Callable, Iterable, Iterator
+
+from . import tune as tu
+from . import groover as gr
+from . import player as pl
+from . import timing as tm
+from . import loeric_utils as lu
+from . import logger as log
+
+
+# sources of the recorded messages
+CONTROL = "c"
+SYNC = "s"
+
+# groover settings stored in the header of an input log
+SETTINGS_DEFAULTS = {
+    "source": None,
+    "repeat": 1,
+    "bpm": None,
+    "midi_channel": 1,
+    "transpose": 0,
+    "diatonic": False,
+    "human_impact": 0,
+    "seed": 0,
+    "config": None,
+    "intensity_control": 10,
+    "human_impact_control": 11,
+    "sync": False,
+}
+
+
+def apply_sync(
+    groover: gr.Groover, msg: mido.Message, stopped: bool, now: float = None
+) -> None:
+    """
+    Apply a tempo, clock, reset or song position message received on the sync port to a groover.
+    Start, stop and continue messages control playback and are left to the caller.
+
+    :param groover: the groover.
+    :param msg: the sync message.
+    :param stopped: whether playback is stopped. Jumps are only applied while stopped.
+    :param now: the time the message was received in seconds. If None, the current time.
+    """
+    if msg.type == "sysex" and msg.data[0] == 69:
+        tempo = sum(msg.data[1:])
+        groover.set_tempo(tempo)
+        log.info("sync", "Received SET TEMPO %d.", tempo)
+    elif msg.type == "reset":
+        groover.reset_clock()
+        log.info("sync", "Received RESET.")
+    elif msg.type == "clock":
+        groover.set_clock(now)
+        log.debug("sync", "Received CLOCK.")
+    elif msg.type == "songpos":
+        log.info("sync", "Received JUMP %d.", msg.pos)
+        if stopped:
+            groover.jump_to_pos(msg.pos)
+        else:
+            log.info("sync", "Ignoring JUMP because playback is active.")
+
+
+class InputRecorder:
+    """
+    Records the control and sync messages received during a performance, to replay them later.
+    Each message is written on a line with its time in seconds since the recorder was created, its source and its bytes in hexadecimal. The first line holds the settings of the performance as JSON.
+    """
+
+    def __init__(self, path: str, settings: dict = None):
+        """
+        Initialize the class and create the log.
+
+        :param path: the path to the input log.
+        :param settings: the groover settings of the performance, among the keys of `SETTINGS_DEFAULTS`.
+        """
+        # control callbacks and the sync thread write concurrently
+        self._lock = threading.Lock()
+        self._file = open(path, "w")
+        self._file.write("# " + json.dumps({} if settings is None else settings) + "\n")
+        self._start = time.perf_counter()
+
+    def record(self, source: str, msg: mido.Message) -> None:
+        """
+        Record a message.
+
+        :param source: where the message was received, `CONTROL` or `SYNC`.
+        :param msg: the message.
+        """
+        now = time.perf_counter() - self._start
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(f"{now:.6f} {source} {msg.hex()}\n")
+
+    def wrap(
+        self, callback: Callable[[mido.Message], None], source: str = CONTROL
+    ) -> Callable[[mido.Message], None]:
+        """
+        Record the messages passed to a callback.
+
+        :param callback: the callback receiving the messages, e.g. a groover's control callback.
+        :param source: where the messages are received.
+
+        :return: a callback recording each message, then passing it to `callback`.
+        """
+
+        def recording_callback(msg):
+            self.record(source, msg)
+            callback(msg)
+
+        return recording_callback
+
+    def close(self) -> None:
+        """
+        Write the remaining messages and close the log.
+        """
+        with self._lock:
+            self._file.close()
+
+
+def load_inputs(path: str) -> tuple[dict, list[tuple[float, str, mido.Message]]]:
+    """
+    Load an input log written by `InputRecorder`.
+
+    :param path: the path to the input log.
+
+    :return: a tuple (settings, inputs), with the groover settings of the recorded performance and its messages as tuples (time, source, message), ordered by time.
+    """
+    settings = {}
+    inputs = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            if line.startswith("#"):
+                settings.update(json.loads(line[1:]))
+                continue
+            t, source, data = line.split(" ", 2)
+            inputs.append((float(t), source, mido.Message.from_hex(data)))
+    inputs.sort(key=lambda i: i[0])
+    return settings, inputs
+
+
+def playback_start(inputs: list[tuple[float, str, mido.Message]]) -> float:
+    """
+    :param inputs: the recorded messages, ordered by time.
+
+    :return: the time playback started in the log, i.e. the time of the first start message, or 0 if playback was not synchronized.
+    """
+    for t, source, msg in inputs:
+        if source == SYNC and msg.type == "start":
+            return t
+    return 0.0
+
+
+def synthetic_controls(
+    controls: list[int], rate: float, start: float = 0.0, seed: int = 0
+) -> Iterator[tuple[float, str, mido.Message]]:
+    """
+    Generate an endless stream of control changes, to load the groover with control traffic.
+    The value of each control follows a random walk.
+
+    :param controls: the control numbers to send, in turn.
+    :param rate: the number of messages per second.
+    :param start: the time of the first message in seconds.
+    :param seed: the seed of the random walk.
+
+    :return: a generator of tuples (time, `CONTROL`, message).
+    """
+    rng = random.Random(seed)
+    values = {control: 64 for control in controls}
+    for i, control in enumerate(itertools.cycle(controls)):
+        values[control] = min(max(values[control] + rng.randint(-4, 4), 0), 127)
+        yield start + i / rate, CONTROL, mido.Message(
+            "control_change", control=control, value=values[control]
+        )
+
+
+class InputReplay:
+    """
+    Feeds recorded control and sync messages back into a groover while it performs.
+    Messages are applied according to the playback time of the performance rather than the wall clock, so that a replay is deterministic, whether it is played in real time or rendered as fast as possible.
+    """
+
+    def __init__(
+        self,
+        groover: gr.Groover,
+        inputs: Iterable[tuple[float, str, mido.Message]],
+        start: float = 0.0,
+        end: float = None,
+    ):
+        """
+        Initialize the class.
+
+        :param groover: the groover performing the tune.
+        :param inputs: the messages as tuples (time, source, message), ordered by time.
+        :param start: the time in the log at which playback started.
+        :param end: the time of the last recorded message. While playback is stopped, later messages cannot continue it and the replay ends, so that endless synthetic inputs do not keep it waiting. If None, every message is waited for.
+        """
+        self._groover = groover
+        self._control_callback = groover.check_midi_control()
+        self._inputs = iter(inputs)
+        self._pending = next(self._inputs, None)
+        self._start = start
+        self._end = end
+
+        self.stopped = False
+        # log time of the last stop and continue messages
+        self._stop_time = None
+        self._continue_time = None
+
+        # number of messages applied
+        self.applied = 0
+        # time spent performing each event
+        self.perform_time = tm.Histogram()
+
+    def _apply_next(self) -> None:
+        """
+        Apply the next recorded message.
+        """
+        t, source, msg = self._pending
+        self._pending = next(self._inputs, None)
+        self.applied += 1
+
+        if source == CONTROL:
+            self._control_callback(msg)
+        elif msg.type == "stop":
+            self.stopped = True
+            self._stop_time = t
+            log.info("sync", "Received STOP.")
+        elif msg.type == "continue":
+            self.stopped = False
+            self._continue_time = t
+            log.info("sync", "Received CONTINUE.")
+        elif msg.type != "start":
+            apply_sync(self._groover, msg, self.stopped, now=t)
+
+    def events(self, player: pl.Player, realtime: bool = False):
+        """
+        Perform the tune one event at a time, applying the recorded messages due before each event.
+        While playback is stopped, the messages are applied until it is continued.
+
+        :param player: the player, reset while playback is stopped.
+        :param realtime: whether to wait as long as playback was stopped in the recording.
+
+        :return: a generator of the lists of messages performed for each event, with the time in seconds spent performing it.
+        """
+        # playback time since the last start or continue
+        origin = self._start
+        position = 0.0
+        while True:
+            while self._pending is not None and self._pending[0] <= origin + position:
+                self._apply_next()
+                if self.stopped:
+                    break
+
+            if self.stopped:
+                player.reset()
+                while (
+                    self.stopped
+                    and self._pending is not None
+                    and (self._end is None or self._pending[0] <= self._end)
+                ):
+                    self._apply_next()
+                if self.stopped:
+                    # the recording ended while stopped
+                    return
+                if realtime:
+                    time.sleep(max(self._continue_time - self._stop_time, 0.0))
+                origin = self._continue_time
+                position = 0.0
+                player.init_playback()
+
+            message = self._groover.next_event()
+            if message is None:
+                return
+            if message.type == "sysex":
+                log.info("main", "Repetition %d", message.data[0] + 1)
+                continue
+
+            perform_start = time.perf_counter()
+            new_messages = self._groover.perform(message)
+            perform_time = time.perf_counter() - perform_start
+            self.perform_time.add(perform_time)
+            position += sum(m.time for m in new_messages)
+            yield new_messages, perform_time
+
+    def play(
+        self, player: pl.Player, realtime: bool = False, end_note: bool = True
+    ) -> None:
+        """
+        Perform the tune on a player, applying the recorded messages.
+
+        :param player: the player.
+        :param realtime: whether the player plays on a port, or the performance is rendered as fast as possible.
+        :param end_note: whether or not to play an end note.
+        """
+        player.init_playback()
+        for new_messages, perform_time in self.events(player, realtime):
+            player.play(new_messages, perform_time)
+
+        if end_note:
+            self._groover.reset_contours()
+            self._groover.advance_contours()
+            player.play(self._groover.get_end_notes())
+        player.silence()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log", help="the input log recorded with --record-inputs.")
+    parser.add_argument(
+        "source",
+        help="the midi file to play. Overrides the tune of the recording.",
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--list-ports",
+        help="list available output MIDI ports and exit.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="the output MIDI port. If given, the replay is played in real time, otherwise it is rendered as fast as possible.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--config",
+        help="the path to a configuration file. Overrides the configuration of the recording.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--load",
+        help="add this many synthetic control changes per second on the intensity and human impact controls.",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--save",
+        help="whether or not to export the performance.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="the output directory for generated performances. Defaults to the tune's directory.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--filename",
+        help="the output filename for the generated performance.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--no-end-note",
+        help="whether or not to play an end note.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--timing-file",
+        help="write the timing of the replay to this file: with an output port, as with loeric --timing-file, otherwise a JSON summary of the time spent performing each event.",
+        type=str,
+        default=None,
+    )
+    args = vars(parser.parse_args())
+
+    _, outport = lu.get_ports(
+        output_number=args["output"],
+        list_ports=args["list_ports"],
+        prompt_out=False,
+    )
+    if args["list_ports"]:
+        return
+
+    recorded, inputs = load_inputs(args["log"])
+    settings = {**SETTINGS_DEFAULTS, **recorded}
+    for key in ["source", "config"]:
+        if args[key] is not None:
+            settings[key] = args[key]
+    if settings["source"] is None:
+        parser.error("the recording does not name its tune, give a source.")
+
+    tune = tu.Tune(settings["source"], settings["repeat"])
+    groover = gr.Groover(
+        tune,
+        bpm=settings["bpm"],
+        midi_channel=settings["midi_channel"] - 1,
+        transpose=settings["transpose"],
+        diatonic_errors=settings["diatonic"],
+        random_weight=0.2,
+        human_impact=settings["human_impact"],
+        seed=settings["seed"],
+        config_file=settings["config"],
+        intensity_control=settings["intensity_control"],
+        human_impact_control=settings["human_impact_control"],
+        syncing=settings["sync"],
+    )
+    if settings["sync"]:
+        groover.compute_checkpoints()
+
+    start = playback_start(inputs)
+    end = inputs[-1][0] if len(inputs) != 0 else None
+    if args["load"] is not None:
+        controls = [settings["intensity_control"], settings["human_impact_control"]]
+        inputs = heapq.merge(
+            inputs,
+            synthetic_controls(controls, args["load"], start=start),
+            key=lambda i: i[0],
+        )
+    replay = InputReplay(groover, inputs, start=start, end=end)
+
+    out = None if outport is None else mido.open_output(outport)
+    player = pl.Player(
+        tempo=groover.tempo,
+        key_signature=tune.key_signature,
+        time_signature=tune.time_signature,
+        save=args["save"],
+        midi_out=out,
+        message_filter=pl.ChangeFilter(),
+    )
+
+    replay_start = time.perf_counter()
+    try:
+        replay.play(player, realtime=out is not None, end_note=not args["no_end_note"])
+    except KeyboardInterrupt:
+        print("\nReplay stopped by user.")
+    elapsed = time.perf_counter() - replay_start
+
+    perform_time = replay.perform_time
+    print(
+        f"Replayed {replay.applied} messages in {elapsed:.3f} s, "
+        f"{perform_time.count} events, perform mean {perform_time.mean * 1000:.3f} ms, "
+        f"p50 {perform_time.percentile(50) * 1000:.3f} ms, "
+        f"p99 {perform_time.percentile(99) * 1000:.3f} ms"
+    )
+    if out is not None:
+        log.info("player", "Timing:\t%s", player.timing)
+
+    if args["timing_file"] is not None:
+        if out is not None:
+            player.timing.export(args["timing_file"])
+        else:
+            with open(args["timing_file"], "w") as f:
+                json.dump({"perform_time": perform_time.summary()}, f, indent=2)
+
+    if args["save"]:
+        player.save(
+            lu.get_output_path(
+                settings["source"],
+                settings["seed"],
+                "replay",
+                output_dir=args["output_dir"],
+                filename=args["filename"],
+            )
+        )
+
+    if out is not None:
+        out.close()
+
+    log.flush()
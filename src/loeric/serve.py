@@ -0,0 +1,558 @@
+import argparse
+import collections
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import traceback
+import mido
+
+from . import tune as tu
+from . import groover as gr
+from . import player as pl
+from . import pipeline as pp
+from . import loeric_utils as lu
+from . import logger as log
+from .batch import load_config
+
+
+# the default path of the control socket
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"loeric-{os.getuid()}.sock")
+
+# tune fields and their default values
+TUNE_DEFAULTS = {
+    "source": None,
+    "config": None,
+    "seed": None,
+    "bpm": None,
+    "transpose": 0,
+    "repeat": 1,
+    "midi_channel": 1,
+    "diatonic": False,
+    "human_impact": 0,
+    "no_end_note": False,
+}
+
+
+class Server:
+    """
+    A LOERIC instance that keeps running between performances.
+    Imports, output ports, merged configurations and parsed tunes are kept in memory, so that tunes can be queued and played one after the other with little delay.
+    Tunes are played by the thread calling `run`, while commands are received from any thread through `handle`.
+    """
+
+    def __init__(
+        self,
+        out: mido.ports.BaseOutput,
+        port: mido.ports.BaseInput = None,
+        defaults: dict = None,
+        lookahead: float = 0.1,
+    ):
+        """
+        Initialize the class.
+
+        :param out: the output port of the performances.
+        :param port: the input port for the control signals, forwarded to the groover of the tune being played.
+        :param defaults: the values used for the tune fields missing from a request.
+        :param lookahead: the maximum time in seconds by which the performance is generated ahead of playback.
+        """
+        self._out = out
+        self._port = port
+        self._defaults = {**TUNE_DEFAULTS, **({} if defaults is None else defaults)}
+        self._lookahead = lookahead
+
+        self._configs = {}
+        self._tunes = {}
+        # tempo set by the last tempo command
+        self._bpm = None
+
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._current = None
+        self._groover = None
+        self._control_callback = None
+        self._stopped = threading.Event()
+        self._closed = False
+
+        if self._port is not None:
+            self._port.callback = self._forward_control
+
+    def _forward_control(self, msg: mido.Message) -> None:
+        """
+        Forward a control message to the groover being played.
+
+        :param msg: the control message.
+        """
+        callback = self._control_callback
+        if callback is not None:
+            callback(msg)
+
+    def _load_config(self, spec) -> dict:
+        """
+        Load a configuration, merging it only once.
+
+        :param spec: the configuration, as in batch manifests.
+
+        :return: the merged configuration.
+        """
+        key = json.dumps(spec, sort_keys=True)
+        if key not in self._configs:
+            self._configs[key] = load_config(spec)
+        return self._configs[key]
+
+    def _load_tune(self, source: str, repeat: int) -> tu.Tune:
+        """
+        Load a tune, parsing it only once.
+
+        :param source: the path to the tune.
+        :param repeat: how many times the tune should be repeated.
+
+        :return: the tune.
+        """
+        key = (os.path.abspath(source), repeat)
+        if key not in self._tunes:
+            self._tunes[key] = tu.Tune(source, repeat)
+        return self._tunes[key]
+
+    def _prepare(self, request: dict) -> dict:
+        """
+        Complete a tune request with the default values, and load its tune and configuration.
+
+        :param request: the tune fields given by the client.
+
+        :return: the tune to play, with all fields set.
+
+        :raise ValueError: if the request has unknown fields or no source.
+        """
+        fields = {k: v for k, v in request.items() if k != "command"}
+        unknown = set(fields) - set(TUNE_DEFAULTS)
+        if len(unknown) != 0:
+            raise ValueError(f"Unknown tune fields {sorted(unknown)}.")
+
+        job = {**self._defaults, **fields}
+        if job["source"] is None:
+            raise ValueError("No source given.")
+        if job["seed"] is None:
+            job["seed"] = int(time.time())
+        job["tune"] = self._load_tune(job["source"], job["repeat"])
+        job["loaded_config"] = self._load_config(job["config"])
+        return job
+
+    def queue(self, request: dict) -> None:
+        """
+        Add a tune at the end of the queue.
+
+        :param request: the tune fields.
+        """
+        job = self._prepare(request)
+        with self._condition:
+            self._queue.append(job)
+            self._condition.notify_all()
+
+    def play(self, request: dict) -> None:
+        """
+        Stop the current tune, empty the queue and play the given tune.
+
+        :param request: the tune fields.
+        """
+        job = self._prepare(request)
+        with self._condition:
+            self._queue.clear()
+            self._queue.append(job)
+            self._stopped.set()
+            self._condition.notify_all()
+
+    def stop(self) -> None:
+        """
+        Stop the current tune and empty the queue.
+        """
+        with self._condition:
+            self._queue.clear()
+            self._stopped.set()
+            self._condition.notify_all()
+
+    def set_tempo(self, bpm: int) -> None:
+        """
+        Set the tempo of the current tune and of the following ones that do not specify their own.
+
+        :param bpm: the tempo in bpm.
+        """
+        self._bpm = bpm
+        groover = self._groover
+        if groover is not None:
+            groover.set_tempo(bpm)
+
+    def configure(self, spec) -> list[str]:
+        """
+        Change the configuration of the current tune and of the following ones that do not specify their own.
+
+        :param spec: the configuration, as in batch manifests.
+
+        :return: the parts of the current performance that were recomputed.
+        """
+        config = self._load_config(spec)
+        self._defaults["config"] = spec
+        groover = self._groover
+        if groover is None or config is None:
+            return []
+        return sorted(groover.reconfigure(config))
+
+    def status(self) -> dict:
+        """
+        :return: the source of the current tune and of the queued ones.
+        """
+        with self._condition:
+            return {
+                "playing": None if self._current is None else self._current["source"],
+                "queue": [job["source"] for job in self._queue],
+                "bpm": self._bpm,
+            }
+
+    def close(self) -> None:
+        """
+        Stop playing and make `run` return.
+        """
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._stopped.set()
+            self._condition.notify_all()
+
+    def handle(self, request: dict) -> dict:
+        """
+        Execute a command.
+
+        :param request: the command, a dictionary with a "command" field among "play", "queue", "stop", "tempo", "config", "status" and "quit", and its arguments.
+
+        :return: the response, with an "ok" field and either the result or an "error".
+        """
+        command = request.get("command")
+        try:
+            if command == "play":
+                self.play(request)
+            elif command == "queue":
+                self.queue(request)
+            elif command == "stop":
+                self.stop()
+            elif command == "tempo":
+                self.set_tempo(request["bpm"])
+            elif command == "config":
+                return {"ok": True, "recomputed": self.configure(request["config"])}
+            elif command == "status":
+                return {"ok": True, **self.status()}
+            elif command == "quit":
+                self.close()
+            else:
+                raise ValueError(f"Unknown command {command}.")
+        except Exception as e:
+            error = "".join(traceback.format_exception_only(e)).strip()
+            return {"ok": False, "error": error}
+        return {"ok": True}
+
+    def _events(self, groover: gr.Groover):
+        """
+        Perform a tune one event at a time, until it ends or is stopped.
+
+        :param groover: the groover performing the tune.
+
+        :return: a generator of the lists of messages performed for each event, with the time in seconds spent performing it.
+        """
+        while not self._stopped.is_set():
+            message = groover.next_event()
+            if message is None:
+                return
+            if message.type == "sysex":
+                continue
+            perform_start = time.perf_counter()
+            new_messages = groover.perform(message)
+            yield new_messages, time.perf_counter() - perform_start
+
+    def _perform(self, job: dict) -> None:
+        """
+        Play a tune on the output port.
+
+        :param job: the tune to play.
+        """
+        tune = job["tune"]
+        groover = gr.Groover(
+            tune,
+            bpm=job["bpm"] if job["bpm"] is not None else self._bpm,
+            midi_channel=job["midi_channel"] - 1,
+            transpose=job["transpose"],
+            diatonic_errors=job["diatonic"],
+            random_weight=0.2,
+            human_impact=job["human_impact"],
+            seed=job["seed"],
+            config=job["loaded_config"],
+        )
+        player = pl.Player(
+            tempo=groover.tempo,
+            key_signature=tune.key_signature,
+            time_signature=tune.time_signature,
+            save=False,
+            midi_out=self._out,
+            message_filter=pl.ChangeFilter(),
+        )
+        self._groover = groover
+        self._control_callback = groover.check_midi_control()
+
+        log.info("main", "Playing:\t%s", job["source"])
+        player.init_playback()
+        try:
+            pp.Pipeline(player, lookahead=self._lookahead).play(
+                self._events(groover)
+            )
+
+            if not self._stopped.is_set() and not job["no_end_note"]:
+                groover.reset_contours()
+                groover.advance_contours()
+                player.play(groover.get_end_notes())
+        finally:
+            # turn off the drones, and the notes cut by a stop
+            player.silence()
+
+        self._control_callback = None
+        self._groover = None
+        log.info("player", "Timing:\t%s", player.timing)
+
+    def run(self) -> None:
+        """
+        Play the queued tunes, waiting for new ones, until the server is closed.
+        """
+        while True:
+            with self._condition:
+                while len(self._queue) == 0 and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                self._current = self._queue.popleft()
+                self._stopped.clear()
+
+            try:
+                self._perform(self._current)
+            except Exception as e:
+                log.warning(
+                    "main", "Could not play %s: %s", self._current["source"], e
+                )
+            finally:
+                with self._condition:
+                    self._current = None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one JSON command per line and writes one JSON response per line.
+    """
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                response = self.server.loeric.handle(json.loads(line))
+            except json.JSONDecodeError as e:
+                response = {"ok": False, "error": f"Invalid request: {e}."}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _SocketServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def send_request(request: dict, path: str = DEFAULT_SOCKET) -> dict:
+    """
+    Send a command to a running server.
+
+    :param request: the command, as accepted by `Server.handle`.
+    :param path: the path of the server's socket.
+
+    :return: the server's response.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall(json.dumps(request).encode() + b"\n")
+        with s.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--socket",
+        help=f"the path of the control socket. Defaults to {DEFAULT_SOCKET}.",
+        type=str,
+        default=DEFAULT_SOCKET,
+    )
+    parser.add_argument(
+        "--list-ports",
+        help="list available input and output MIDI ports and exit.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="the input MIDI port for the control signals.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="the output MIDI port for the performances.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--config",
+        help="the configuration of tunes that do not specify one.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="how many times tunes that do not specify it are repeated.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-mc",
+        "--midi-channel",
+        help="the output MIDI channel of tunes that do not specify one.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--lookahead",
+        help="how many milliseconds ahead of playback the performance is generated.",
+        type=float,
+        default=100,
+    )
+    args = vars(parser.parse_args())
+
+    inport, outport = lu.get_ports(
+        input_number=args["input"],
+        output_number=args["output"],
+        list_ports=args["list_ports"],
+        prompt_out=args["output"] is None,
+    )
+    if args["list_ports"]:
+        return
+
+    port = None if inport is None else mido.open_input(inport)
+    out = mido.open_output(outport)
+
+    server = Server(
+        out,
+        port=port,
+        defaults={
+            "config": args["config"],
+            "repeat": args["repeat"],
+            "midi_channel": args["midi_channel"],
+        },
+        lookahead=args["lookahead"] / 1000,
+    )
+
+    # remove the socket of a previous run
+    if os.path.exists(args["socket"]):
+        os.remove(args["socket"])
+    socket_server = _SocketServer(args["socket"], _RequestHandler)
+    socket_server.loeric = server
+    socket_thread = threading.Thread(target=socket_server.serve_forever, daemon=True)
+    socket_thread.start()
+    print(f"Listening on {args['socket']}")
+
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        print("\nServer stopped by user.")
+
+    socket_server.shutdown()
+    socket_server.server_close()
+    os.remove(args["socket"])
+
+    if port is not None:
+        port.close()
+    out.close()
+
+    log.flush()
+
+
+def client_main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command",
+        help="the command to send to the server.",
+        choices=["play", "queue", "stop", "tempo", "config", "status", "quit"],
+    )
+    parser.add_argument(
+        "values",
+        help="the tunes to play or queue, the tempo in bpm, or the configuration file.",
+        nargs="*",
+    )
+    parser.add_argument(
+        "--socket",
+        help=f"the path of the server's socket. Defaults to {DEFAULT_SOCKET}.",
+        type=str,
+        default=DEFAULT_SOCKET,
+    )
+    parser.add_argument(
+        "--config", help="the configuration of the tunes.", type=str, default=None
+    )
+    parser.add_argument("--seed", help="the seed of the tunes.", type=int, default=None)
+    parser.add_argument("-bpm", help="the tempo of the tunes.", type=int, default=None)
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="how many times the tunes are repeated.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-t",
+        "--transpose",
+        help="the number of semitones to transpose the tunes of.",
+        type=int,
+        default=None,
+    )
+    args = vars(parser.parse_args())
+
+    requests = []
+    if args["command"] in ["play", "queue"]:
+        if len(args["values"]) == 0:
+            parser.error(f"{args['command']} needs at least one tune.")
+        fields = {
+            k: args[k]
+            for k in ["config", "seed", "bpm", "repeat", "transpose"]
+            if args[k] is not None
+        }
+        for i, source in enumerate(args["values"]):
+            # play the first tune and queue the others
+            command = "queue" if i != 0 else args["command"]
+            requests.append(
+                {"command": command, "source": os.path.abspath(source), **fields}
+            )
+    elif args["command"] == "tempo":
+        if len(args["values"]) != 1:
+            parser.error("tempo needs a value in bpm.")
+        requests.append({"command": "tempo", "bpm": int(args["values"][0])})
+    elif args["command"] == "config":
+        if len(args["values"]) != 1:
+            parser.error("config needs a configuration file.")
+        requests.append(
+            {"command": "config", "config": os.path.abspath(args["values"][0])}
+        )
+    else:
+        requests.append({"command": args["command"]})
+
+    for request in requests:
+        response = send_request(request, args["socket"])
+        if not response.pop("ok"):
+            print(f"Error:\t{response['error']}")
+        elif len(response) != 0:
+            print(json.dumps(response))
@@ -1,6 +1,5 @@
 import mido
 import os
-import pandas as pd
 import numpy as np
 import re
 import math
@@ -10,8 +9,14 @@ import time
 import traceback
 import json
 import argparse
+import heapq
+import itertools
+import queue
 from collections import defaultdict
 
+from . import loeric_utils as lu
+from . import csv_log as cl
+
 
 songpos_wait = 0
 last_tempo = 0
@@ -23,6 +28,32 @@ stop_sync_duration = 0
 exiting = threading.Event()
 port_lock = threading.Lock()
 all_dead = threading.Semaphore(value=2)
+# longest time in seconds a receive loop waits before checking if it should exit
+EXIT_CHECK_INTERVAL = 0.1
+
+
+def listen(inports) -> queue.SimpleQueue:
+    """
+    Receive the messages of the given ports through their callbacks, so that no thread polls them.
+
+    :param inports: the input ports.
+
+    :return: the queue where a tuple (time received, port, message) is put for each message.
+    """
+    events = queue.SimpleQueue()
+    for port in inports:
+        port.callback = lambda msg, port=port: events.put((time.time(), port, msg))
+    return events
+
+
+def stop_listening(inports) -> None:
+    """
+    Remove the callbacks set by `listen`. Messages are queued by the ports again.
+
+    :param inports: the input ports.
+    """
+    for port in inports:
+        port.callback = None
 
 
 def send_tempo(tempo, port):
@@ -53,18 +84,17 @@ def sync_intensity(inports, outports):
     int_dict = defaultdict(int)
     hi_dict = defaultdict(int)
     action_dict = {}
-    df_action = pd.DataFrame(columns=["TIME", "ID", "ACTION", "GROUP"])
-    df_values = pd.DataFrame(columns=["TIME", "ID", "TYPE", "VALUE", "PARAM"])
+    # written while the shell runs
+    action_log = cl.CsvLog("action_log.csv", ["TIME", "ID", "ACTION", "GROUP"])
+    values_log = cl.CsvLog("values_log.csv", ["TIME", "ID", "TYPE", "VALUE", "PARAM"])
+    events = listen(inports)
     while not exiting.is_set():
         try:
-            # receive message and port
-            bundle = list(
-                mido.ports.multi_receive(inports, yield_ports=True, block=False)
-            )
-            now = time.time()
-            if len(bundle) == 0:
+            # wait for a message and its port
+            try:
+                now, port, msg = events.get(timeout=EXIT_CHECK_INTERVAL)
+            except queue.Empty:
                 continue
-            port, msg = bundle[0]
             if msg.type != "control_change" or (
                 msg.control != config["human_impact_control_in"]
                 and msg.control != config["intensity_control_in"]
@@ -74,29 +104,18 @@ def sync_intensity(inports, outports):
             # who sent this?
             loeric_id = re.search("#.*#", port.name)[0]
 
-            now = time.time()
             # keep track of intensity
             if msg.control == config["intensity_control_in"]:
                 int_dict[loeric_id] = msg.value / 127
 
-                df_values.loc[len(df_values)] = [
-                    now,
-                    loeric_id,
-                    "receive",
-                    msg.value,
-                    "intensity",
-                ]
+                values_log.append(now, loeric_id, "receive", msg.value, "intensity")
             # keep track of human_impact
             elif msg.control == config["human_impact_control_in"]:
                 hi_dict[loeric_id] = msg.value / 127
 
-                df_values.loc[len(df_values)] = [
-                    now,
-                    loeric_id,
-                    "receive",
-                    msg.value,
-                    "human_impact",
-                ]
+                values_log.append(
+                    now, loeric_id, "receive", msg.value, "human_impact"
+                )
 
             # don't consider human for actions
             if "HUMAN" in port.name:
@@ -140,7 +159,7 @@ def sync_intensity(inports, outports):
 
                 action_dict[loeric_id] = (now, action, group)
                 print(loeric_id, action, group)
-                df_action.loc[len(df_action)] = [now, loeric_id, action, group]
+                action_log.append(now, loeric_id, action, group)
 
             # output port
             out_port = None
@@ -219,26 +238,15 @@ def sync_intensity(inports, outports):
                 )
                 out_port.send(msg)
 
-            df_values.loc[len(df_values)] = [
-                now,
-                loeric_id,
-                "send",
-                int_value,
-                "intensity",
-            ]
-            df_values.loc[len(df_values)] = [
-                now,
-                loeric_id,
-                "send",
-                hi_value,
-                "human_impact",
-            ]
+            values_log.append(now, loeric_id, "send", int_value, "intensity")
+            values_log.append(now, loeric_id, "send", hi_value, "human_impact")
 
         except Exception as e:
             traceback.print_exception(e)
             exiting.set()
-    df_action.to_csv("action_log.csv")
-    df_values.to_csv("values_log.csv")
+    stop_listening(inports)
+    action_log.close()
+    values_log.close()
     all_dead.release()
     shell_print("Intensity Sync OFF.")
 
@@ -249,40 +257,33 @@ def sync_loeric(inports, outports):
     shell_print("Sync ON.")
     pos_dict = {}
     updated_dict = defaultdict(bool)
+    # (wake up time, order, id, port, position) of the stopped loerics
     sleepers = []
+    order = itertools.count()
+    events = listen(inports)
     while not exiting.is_set():
         try:
 
             # awake sleeping loerics
-            new_sleepers = []
-            for s in sleepers:
-
+            current = time.time()
+            while len(sleepers) != 0 and sleepers[0][0] <= current:
+                _, _, lid, port, pos = heapq.heappop(sleepers)
+                with port_lock:
+                    pos_dict[lid] = (current, pos)
+                    port.send(mido.Message("continue"))
+                    # shell_print(re.search("#.*#", port.name)[0])
+                    # shell_print(f"{lid}: AWAKEN at {pos}")
+                    # shell_print()
                 current = time.time()
 
-                lid, start_time, wait_time, port, pos = s
-
-                # if enough time has passed
-                if current - start_time >= wait_time:
-                    with port_lock:
-                        pos_dict[lid] = (current, pos)
-                        port.send(mido.Message("continue"))
-                        # shell_print(re.search("#.*#", port.name)[0])
-                        # shell_print(f"{lid}: AWAKEN at {pos}")
-                        # shell_print()
-                else:
-                    # put them back
-                    new_sleepers.append(s)
-
-            sleepers = new_sleepers
-
-            # receive message and port
-            bundle = list(
-                mido.ports.multi_receive(inports, yield_ports=True, block=False)
-            )
-            now = time.time()
-            if len(bundle) == 0:
+            # wait for a message or the next wake up
+            timeout = EXIT_CHECK_INTERVAL
+            if len(sleepers) != 0:
+                timeout = min(timeout, max(sleepers[0][0] - current, 0))
+            try:
+                now, port, msg = events.get(timeout=timeout)
+            except queue.Empty:
                 continue
-            port, msg = bundle[0]
             if msg.type != "songpos":
                 continue
 
@@ -364,15 +365,16 @@ def sync_loeric(inports, outports):
 
                 # shell_print(f"{loeric_id}: SLEEP at {pos}")
 
-                sleepers.append(
+                heapq.heappush(
+                    sleepers,
                     # in (songpos wait - diff) the reference will be at p+1
                     (
+                        now + songpos_wait - (now - timestamp),
+                        next(order),
                         loeric_id,
-                        now,
-                        songpos_wait - (now - timestamp),
                         out_port,
                         pos + 1,
-                    )
+                    ),
                 )
 
             # soft fix
@@ -397,6 +399,7 @@ def sync_loeric(inports, outports):
         except Exception as e:
             traceback.print_exception(e)
             exiting.set()
+    stop_listening(inports)
     all_dead.release()
     shell_print("Sync OFF.")
 
@@ -436,9 +439,18 @@ def main():
     parser.add_argument(
         "--config", default=f"{dir_path}/loeric_config/shell/config.json", type=str
     )
+    parser.add_argument(
+        "--profile-startup",
+        help="print how long importing the shell and its dependencies takes and exit.",
+        action="store_true",
+    )
     args = parser.parse_args()
     args = vars(args)
 
+    if args["profile_startup"]:
+        lu.profile_startup("loeric.synchronize", deferred=[])
+        return
+
     global config, sync_thread, intensity_thread
 
     # load base config
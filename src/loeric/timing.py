@@ -0,0 +1,210 @@
+import csv
+import json
+import math
+
+
+class Histogram:
+    """
+    A streaming histogram of durations with logarithmic bins.
+    Each bin is `growth` times wider than the previous one, so that percentiles have the same relative precision from microseconds to seconds, in constant memory.
+    """
+
+    def __init__(self, smallest: float = 1e-6, growth: float = 1.05):
+        """
+        Initialize the class.
+
+        :param smallest: the upper edge of the first bin in seconds. Smaller values, including negative ones, fall in the first bin.
+        :param growth: the ratio between the edges of two consecutive bins.
+        """
+        self._smallest = smallest
+        self._log_growth = math.log(growth)
+        self._growth = growth
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget all the values.
+        """
+        self.bins = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        """
+        Record a value.
+
+        :param value: the value in seconds.
+        """
+        if value <= self._smallest:
+            index = 0
+        else:
+            index = math.ceil(math.log(value / self._smallest) / self._log_growth)
+        self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def edge(self, index: int) -> float:
+        """
+        :param index: the index of a bin.
+
+        :return: the upper edge of the bin in seconds.
+        """
+        return self._smallest * self._growth**index
+
+    @property
+    def mean(self) -> float:
+        """
+        :return: the mean value in seconds.
+        """
+        return 0.0 if self.count == 0 else self.total / self.count
+
+    def percentile(self, p: float) -> float:
+        """
+        Estimate a percentile from the bins.
+
+        :param p: the percentile, between 0 and 100.
+
+        :return: the upper edge of the bin holding the percentile, clamped to the observed range. 0 if no value was recorded.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        # the bins can be updated by the player while they are read
+        bins = self.bins.copy()
+        for index in sorted(bins):
+            seen += bins[index]
+            if seen >= rank:
+                return min(max(self.edge(index), self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """
+        :return: the count, mean, extremes, main percentiles and non empty bins of the histogram, in seconds.
+        """
+        bins = self.bins.copy()
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min if self.count != 0 else 0.0,
+            "max": self.max if self.count != 0 else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p99.9": self.percentile(99.9),
+            # upper edge of each bin, number of values
+            "histogram": [[self.edge(index), bins[index]] for index in sorted(bins)],
+        }
+
+
+class TimingStats:
+    """
+    Timing of the messages sent by a player.
+    For every message, the time at which it was scheduled, the time it was actually sent and the time spent generating the event that produced it are recorded.
+    Lateness and generation times are accumulated in streaming histograms; the single measurements are also kept, unless disabled, to be exported as CSV.
+    """
+
+    # messages later than this many seconds are counted as late
+    LATE = 0.001
+
+    def __init__(self, keep_records: bool = True):
+        """
+        Initialize the class.
+
+        :param keep_records: whether or not to keep every measurement, besides the histograms.
+        """
+        self._keep_records = keep_records
+        self.lateness = Histogram()
+        self.perform_time = Histogram()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget all the measurements.
+        """
+        self.lateness.reset()
+        self.perform_time.reset()
+        self.late = 0
+        # (scheduled time, send time, perform time) of each message
+        self.records = []
+
+    def add(self, scheduled: float, sent: float, perform_time: float = None) -> None:
+        """
+        Record the timing of a message.
+
+        :param scheduled: the time the message was due, in seconds since the start of playback.
+        :param sent: the time the message was sent, in seconds since the start of playback.
+        :param perform_time: the time in seconds spent by the groover performing the event that produced the message, if known.
+        """
+        lateness = sent - scheduled
+        self.lateness.add(lateness)
+        if lateness > self.LATE:
+            self.late += 1
+        if perform_time is not None:
+            self.perform_time.add(perform_time)
+        if self._keep_records:
+            self.records.append((scheduled, sent, perform_time))
+
+    @property
+    def count(self) -> int:
+        """
+        :return: the number of messages recorded.
+        """
+        return self.lateness.count
+
+    def summary(self) -> dict:
+        """
+        :return: the lateness and perform time statistics, in seconds.
+        """
+        return {
+            "messages": self.count,
+            "late": self.late,
+            "lateness": self.lateness.summary(),
+            "perform_time": self.perform_time.summary(),
+        }
+
+    def export(self, path: str) -> None:
+        """
+        Write the measurements to a file.
+        CSV files hold one row per message with its scheduled time, send time, lateness and perform time in seconds; any other file holds the JSON summary.
+
+        :param path: the path to the output file. Its extension selects the format.
+        """
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["scheduled", "sent", "lateness", "perform_time"])
+                for scheduled, sent, perform_time in self.records:
+                    writer.writerow(
+                        [
+                            scheduled,
+                            sent,
+                            sent - scheduled,
+                            "" if perform_time is None else perform_time,
+                        ]
+                    )
+        else:
+            with open(path, "w") as f:
+                json.dump(self.summary(), f, indent=2)
+
+    def __str__(self) -> str:
+        lateness = self.lateness
+        result = (
+            f"{self.count} messages, lateness mean {lateness.mean * 1000:.3f} ms, "
+            f"p50 {lateness.percentile(50) * 1000:.3f} ms, "
+            f"p99 {lateness.percentile(99) * 1000:.3f} ms, "
+            f"max {max(lateness.max, 0) * 1000:.3f} ms, "
+            f"{self.late} later than {self.LATE * 1000:g} ms"
+        )
+        if self.perform_time.count != 0:
+            result += (
+                f"; perform p50 {self.perform_time.percentile(50) * 1000:.3f} ms, "
+                f"p99 {self.perform_time.percentile(99) * 1000:.3f} ms"
+            )
+        return result
@@ -1,13 +1,15 @@
 import mido
 import numpy as np
-import muspy as mp
-import music21 as m21
 
 from collections.abc import Callable
-from typing import Generator
+from typing import Generator, TYPE_CHECKING
 
 from . import loeric_utils as lu
 
+# music21 and muspy are slow to import and only needed to load tunes
+if TYPE_CHECKING:
+    import music21 as m21
+
 
 class Tune:
     """A wrapper for a midi file."""
@@ -24,6 +26,8 @@ class Tune:
         :param repeats: how many times the tune should be repeated.
 
         """
+        import muspy as mp
+
         self._filename = filename
         if filename.endswith(".mid"):
             mido_source = mp.read_midi(filename)
@@ -111,17 +115,25 @@ class Tune:
             all_events[i].time = float(all_timestamps[i])
 
         self.index_map = {}
+        self.duration_map = {}
         contour_index = 0
+        cumulative_time = 0
         for i, msg in enumerate(all_events):
+            cumulative_time += msg.time
             if msg.type == "songpos":
                 # map songpos to next note and contour index
                 self.index_map[msg.pos] = (i, contour_index)
+                # and to the performance time at that point
+                self.duration_map[msg.pos] = cumulative_time - self._offset
             elif lu.is_note_on(msg):
                 contour_index += 1
 
         self._midi = all_events
         self._max_songpos = max(self.index_map.keys())
 
+        # values of contours that only depend on the tune, see `contour.shared`
+        self.contour_cache = {}
+
         print(f"Playing:\t{filename}")
         print(f"Meter:\t{self._time_signature}")
         print(f"Key:\t{self._key_signature}")
@@ -169,7 +181,7 @@ class Tune:
         return self._key_signature
 
     @property
-    def time_signature(self) -> m21.meter.TimeSignature:
+    def time_signature(self) -> "m21.meter.TimeSignature":
         """
         :return: the tune's time signature.
         """
@@ -240,6 +252,8 @@ class Tune:
 
         :return: the length of the pickup bar in seconds.
         """
+        import music21 as m21
+
         # retrieve duration of first bar
         m21_source = m21.converter.parse(self._filename)
 
@@ -266,7 +280,7 @@ class Tune:
             return None
         return msg[0].tempo
 
-    def _get_time_signature(self) -> m21.meter.TimeSignature:
+    def _get_time_signature(self) -> "m21.meter.TimeSignature":
         """
         Retrieve the time signature of the tune, if there is any.
         Only the first time signature will be retrieved.
@@ -278,6 +292,8 @@ class Tune:
         msg = self.filter(lambda x: x.type == "time_signature")
         if len(msg) == 0:
             return None
+        import music21 as m21
+
         time_signature = m21.meter.TimeSignature()
         time_signature.numerator = msg[0].numerator
         time_signature.denominator = msg[0].denominator
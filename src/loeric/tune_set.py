@@ -0,0 +1,392 @@
+import argparse
+import concurrent.futures
+import os
+import time
+import mido
+
+from . import tune as tu
+from . import groover as gr
+from . import player as pl
+from . import pipeline as pp
+from . import loeric_utils as lu
+from . import logger as log
+from .batch import load_config
+
+
+def load_playlist(path: str) -> list[str]:
+    """
+    Load a playlist.
+    The playlist is a text file with the path of one tune per line. Empty lines and lines starting with # are ignored.
+    Relative tune paths are resolved with respect to the playlist's directory.
+
+    :param path: the path to the playlist.
+
+    :return: the paths of the tunes.
+    """
+    root = os.path.dirname(os.path.abspath(path))
+    sources = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            sources.append(os.path.join(root, os.path.expanduser(line)))
+    return sources
+
+
+class TuneSet:
+    """
+    Several tunes performed back to back, as a set in a session.
+    While a tune is played, the next one is parsed and its groover, with its contours, is built by a background worker, so that the next tune starts right after the last note of the previous one.
+    Every tune is played at the tempo of the set, and tempo and control changes carry over from one tune to the next.
+    """
+
+    def __init__(
+        self,
+        sources: list[str],
+        repeat: int = 1,
+        bpm: int = None,
+        seed: int = 0,
+        config: dict = None,
+        **groover_args,
+    ):
+        """
+        Initialize the class and prepare the first tune.
+
+        :param sources: the paths of the tunes, in the order they are played.
+        :param repeat: how many times each tune is repeated.
+        :param bpm: the tempo of the set in bpm. If None, the tempo of the first tune is used.
+        :param seed: the random seed of the first tune. The following tunes use the next seeds.
+        :param config: the loaded configuration of the groovers.
+        :param groover_args: the other arguments of the groovers, e.g. `midi_channel` or `transpose`.
+        """
+        self._sources = sources
+        self._repeat = repeat
+        self._bpm = bpm
+        self._seed = seed
+        self._config = config
+        self._groover_args = groover_args
+
+        # tempo set during playback
+        self._external_bpm = None
+        # last value received for each control number
+        self._controls = {}
+        self._control_callback = None
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.index = 0
+        self.tune, self.groover = self._prepare(0)
+        if self._bpm is None:
+            self._bpm = round(mido.tempo2bpm(self.groover.tempo))
+
+    def _prepare(self, index: int) -> tuple[tu.Tune, gr.Groover]:
+        """
+        Parse a tune and build its groover.
+        The global random generators are left untouched, since the previous tune may be performing.
+
+        :param index: the index of the tune in the set.
+
+        :return: a tuple (tune, groover).
+        """
+        start = time.perf_counter()
+        tune = tu.Tune(self._sources[index], self._repeat)
+        groover = gr.Groover(
+            tune,
+            bpm=self._bpm,
+            seed=self._seed + index,
+            config=self._config,
+            seed_random=False,
+            **self._groover_args,
+        )
+        log.debug(
+            "main",
+            "Prepared %s in %.3f s",
+            self._sources[index],
+            time.perf_counter() - start,
+        )
+        return tune, groover
+
+    def check_midi_control(self):
+        """
+        Returns a function that forwards MIDI control messages to the groover of the tune being played.
+
+        :return: a callback function that updates the current groover.
+        """
+
+        def callback(msg):
+            if msg.type == "control_change":
+                self._controls[msg.control] = msg
+            if self._control_callback is not None:
+                self._control_callback(msg)
+
+        return callback
+
+    def set_tempo(self, bpm: int) -> None:
+        """
+        Set the tempo of the tune being played and of the following ones.
+
+        :param bpm: the tempo in bpm.
+        """
+        self._external_bpm = bpm
+        self.groover.set_tempo(bpm)
+
+    def _hand_over(self, tune: tu.Tune, groover: gr.Groover) -> None:
+        """
+        Make a groover the current one, passing it the live tempo and control values.
+
+        :param tune: the next tune.
+        :param groover: the groover of the next tune.
+        """
+        groover.seed_random()
+        if self._external_bpm is not None:
+            groover.set_tempo(self._external_bpm)
+        callback = groover.check_midi_control()
+        for msg in self._controls.values():
+            callback(msg)
+        self.tune = tune
+        self.groover = groover
+        self._control_callback = callback
+
+    def events(self):
+        """
+        Perform the tunes one after the other, one event at a time.
+        The next tune is prepared in the background while the current one is performed.
+
+        :return: a generator of the lists of messages performed for each event, with the time in seconds spent performing it.
+        """
+        self._hand_over(self.tune, self.groover)
+        for index in range(len(self._sources)):
+            if index != 0:
+                # the drones of the previous tune end with its last note
+                yield self.groover.release_drones(), 0.0
+                self._hand_over(*future.result())
+            self.index = index
+            if index + 1 < len(self._sources):
+                future = self._executor.submit(self._prepare, index + 1)
+
+            log.info(
+                "main",
+                "Tune %d/%d:\t%s",
+                index + 1,
+                len(self._sources),
+                self._sources[index],
+            )
+            while True:
+                message = self.groover.next_event()
+                if message is None:
+                    break
+                if message.type == "sysex":
+                    log.info("main", "Repetition %d", message.data[0] + 1)
+                    continue
+                perform_start = time.perf_counter()
+                new_messages = self.groover.perform(message)
+                yield new_messages, time.perf_counter() - perform_start
+
+        self._executor.shutdown()
+
+    def play(
+        self, player: pl.Player, end_note: bool = True, lookahead: float = 0.1
+    ) -> None:
+        """
+        Perform the set on a player.
+
+        :param player: the player.
+        :param end_note: whether or not to play an end note after the last tune.
+        :param lookahead: the maximum time in seconds by which the performance is generated ahead of playback. If 0, each event is generated right before it is played.
+        """
+        player.init_playback()
+        if lookahead > 0:
+            pp.Pipeline(player, lookahead=lookahead).play(self.events())
+        else:
+            for new_messages, perform_time in self.events():
+                player.play(new_messages, perform_time)
+
+        if end_note:
+            self.groover.reset_contours()
+            self.groover.advance_contours()
+            player.play(self.groover.get_end_notes())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "sources",
+        help="the tunes to play in order, or a playlist file (.txt) listing them.",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--list-ports",
+        help="list available input and output MIDI ports and exit.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="the input MIDI port for the control signals.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="the output MIDI port for the performance.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-n",
+        "--name",
+        help="the name of this set, used in the output filename.",
+        type=str,
+        default="set",
+    )
+    parser.add_argument(
+        "-mc",
+        "--midi-channel",
+        help="the output MIDI channel for the performance.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-t",
+        "--transpose",
+        help="the number of semitones to transpose the tunes of.",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "-d",
+        "--diatonic",
+        help="whether or not error generation should be quantized to the tunes' mode.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="how many times each tune should be repeated.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-bpm",
+        help="the tempo of the set. If None, defaults to the first tune's tempo.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--seed",
+        help="the random seed of the first tune, the next tunes use the following seeds.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--config",
+        help="the path to a configuration file.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--save",
+        help="whether or not to export the performance. If no output port is given, the set is rendered without playback.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="the output directory for generated performances. Defaults to the first tune's directory.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--filename",
+        help="the output filename for the generated performance.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--no-end-note",
+        help="whether or not to play an end note after the last tune.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--lookahead",
+        help="how many milliseconds ahead of playback the performance is generated.",
+        type=float,
+        default=100,
+    )
+    args = vars(parser.parse_args())
+
+    inport, outport = lu.get_ports(
+        input_number=args["input"],
+        output_number=args["output"],
+        list_ports=args["list_ports"],
+        prompt_out=args["output"] is None and not args["save"],
+    )
+    if args["list_ports"]:
+        return
+
+    sources = []
+    for source in args["sources"]:
+        if source.endswith(".txt"):
+            sources.extend(load_playlist(source))
+        else:
+            sources.append(source)
+
+    if args["seed"] is None:
+        args["seed"] = int(time.time())
+
+    tune_set = TuneSet(
+        sources,
+        repeat=args["repeat"],
+        bpm=args["bpm"],
+        seed=args["seed"],
+        config=load_config(args["config"]),
+        midi_channel=args["midi_channel"] - 1,
+        transpose=args["transpose"],
+        diatonic_errors=args["diatonic"],
+        random_weight=0.2,
+    )
+
+    port = None if inport is None else mido.open_input(inport)
+    if port is not None:
+        port.callback = tune_set.check_midi_control()
+    out = None if outport is None else mido.open_output(outport)
+
+    player = pl.Player(
+        tempo=tune_set.groover.tempo,
+        key_signature=tune_set.tune.key_signature,
+        time_signature=tune_set.tune.time_signature,
+        save=args["save"],
+        midi_out=out,
+        message_filter=pl.ChangeFilter(),
+    )
+
+    try:
+        tune_set.play(
+            player,
+            end_note=not args["no_end_note"],
+            lookahead=args["lookahead"] / 1000 if out is not None else 0,
+        )
+    except KeyboardInterrupt:
+        print("\nPlayback stopped by user.")
+
+    # make sure to turn off the notes still sounding
+    player.silence()
+
+    if args["save"]:
+        player.save(
+            lu.get_output_path(
+                sources[0],
+                args["seed"],
+                args["name"],
+                output_dir=args["output_dir"],
+                filename=args["filename"],
+            )
+        )
+
+    if port is not None:
+        port.close()
+
+    if out is not None:
+        out.close()
+
+    log.flush()
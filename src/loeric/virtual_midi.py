@@ -0,0 +1,204 @@
+import queue
+import threading
+import time
+import mido
+
+from mido import ports
+
+
+# ports that can be opened, by name
+# virtual outputs, that inputs connect to
+_sources = {}
+# virtual inputs, that outputs connect to
+_destinations = {}
+# only taken when ports are opened or closed, never when sending
+_registry_lock = threading.Lock()
+
+
+def use() -> None:
+    """
+    Make mido open its ports with this backend, as with `MIDO_BACKEND=loeric.virtual_midi`.
+    """
+    mido.set_backend(__name__, load=True)
+
+
+def get_devices(**kwargs) -> list[dict]:
+    """
+    List the open virtual ports, as mido backends do.
+    A virtual output can be opened as input by other ports, and a virtual input as output.
+
+    :return: a dictionary with the name and direction of each port.
+    """
+    with _registry_lock:
+        return [
+            {"name": name, "is_input": True, "is_output": False}
+            for name in _sources
+        ] + [
+            {"name": name, "is_input": False, "is_output": True}
+            for name in _destinations
+        ]
+
+
+def _first(names: dict, name: str) -> str:
+    """
+    :param names: the open ports of a direction.
+    :param name: the name of a port, or None for the first open one.
+
+    :return: the name of the port.
+    """
+    if name is not None:
+        return name
+    if len(names) == 0:
+        raise OSError("no ports available")
+    return next(iter(names))
+
+
+class Input(ports.BaseInput):
+    """
+    An input port receiving the messages sent to it in the same process.
+    Messages are queued in a lock-free queue, or passed to the callback in the sender's thread if one is set.
+    Each message received holds in its `time` attribute the time it was sent, on the `time.perf_counter` clock.
+    """
+
+    _locking = False
+    _device_type = "LOERIC virtual"
+
+    def _open(self, virtual: bool = False, callback=None, **kwargs) -> None:
+        """
+        Create the port, or connect it to a virtual output.
+
+        :param virtual: whether to create a new port that outputs can connect to.
+        :param callback: the function called with every message received.
+        """
+        self._queue = queue.SimpleQueue()
+        self._callback = None
+        self._virtual = virtual
+        self._source = None
+
+        with _registry_lock:
+            if virtual:
+                if self.name in _destinations:
+                    raise OSError(f"port {self.name!r} already exists")
+                _destinations[self.name] = self
+            else:
+                self.name = _first(_sources, self.name)
+                if self.name not in _sources:
+                    raise OSError(f"unknown port {self.name!r}")
+                self._source = _sources[self.name]
+                self._source._receivers = (*self._source._receivers, self)
+
+        self.callback = callback
+
+    def _close(self) -> None:
+        """
+        Disconnect the port and wake up a blocked `receive`.
+        """
+        with _registry_lock:
+            if self._virtual:
+                _destinations.pop(self.name, None)
+            elif self._source is not None:
+                self._source._receivers = tuple(
+                    r for r in self._source._receivers if r is not self
+                )
+        self._callback = None
+        self._queue.put(None)
+
+    def _deliver(self, msg: mido.Message) -> None:
+        """
+        Receive a message from an output.
+
+        :param msg: the message.
+        """
+        callback = self._callback
+        if callback is not None:
+            callback(msg)
+        else:
+            self._queue.put(msg)
+
+    @property
+    def callback(self):
+        return self._callback
+
+    @callback.setter
+    def callback(self, func) -> None:
+        if func is not None:
+            # the callback gets the queued messages first
+            while True:
+                try:
+                    msg = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if msg is not None:
+                    func(msg)
+        self._callback = func
+
+    # receive and poll are overridden to bypass locking
+    def receive(self, block: bool = True) -> mido.Message:
+        if self.closed and self._queue.empty():
+            if block:
+                raise ValueError("receive() called on closed port")
+            return None
+        try:
+            msg = self._queue.get(block=block)
+        except queue.Empty:
+            return None
+        if msg is None:
+            raise OSError("port closed during receive()")
+        return msg
+
+    def poll(self) -> mido.Message:
+        return self.receive(block=False)
+
+    receive.__doc__ = ports.BaseInput.receive.__doc__
+    poll.__doc__ = ports.BaseInput.poll.__doc__
+
+
+class Output(ports.BaseOutput):
+    """
+    An output port sending messages to the inputs connected to it in the same process.
+    Sending stamps the message with the current time and hands it to each input, without locking.
+    """
+
+    _locking = False
+    _device_type = "LOERIC virtual"
+
+    def _open(self, virtual: bool = False, **kwargs) -> None:
+        """
+        Create the port, or connect it to a virtual input.
+
+        :param virtual: whether to create a new port that inputs can connect to.
+        """
+        self._virtual = virtual
+        # replaced, never modified, so that sending does not need a lock
+        self._receivers = ()
+
+        with _registry_lock:
+            if virtual:
+                if self.name in _sources:
+                    raise OSError(f"port {self.name!r} already exists")
+                _sources[self.name] = self
+            else:
+                self.name = _first(_destinations, self.name)
+                if self.name not in _destinations:
+                    raise OSError(f"unknown port {self.name!r}")
+                self._receivers = (_destinations[self.name],)
+
+    def _close(self) -> None:
+        """
+        Disconnect the port.
+        """
+        with _registry_lock:
+            if self._virtual:
+                _sources.pop(self.name, None)
+        self._receivers = ()
+
+    # send is overridden to bypass locking
+    def send(self, msg: mido.Message) -> None:
+        if self.closed:
+            raise ValueError("send() called on closed port")
+        now = time.perf_counter()
+        for receiver in self._receivers:
+            if not receiver.closed:
+                receiver._deliver(msg.copy(time=now))
+
+    send.__doc__ = ports.BaseOutput.send.__doc__